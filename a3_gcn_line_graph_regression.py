@@ -15,6 +15,9 @@ from torch_geometric.utils.convert import from_networkx
 from torch_geometric.nn import GCNConv
 from torch_geometric.data import Data
 import matplotlib.pyplot as plt
+from refactor.approaches.training import EarlyStopping
+from refactor.utils.files import read_criticality
+from refactor.utils.graphs import normalized_adjacency
 
 
 GRAPH = "itaipu11"
@@ -26,7 +29,11 @@ TRAIN_SPLIT = [0.1, 0.2, 0.3, 0.4, 0.5]
 DROPOUT = 0.5
 CHANNELS = [32]
 NUM_EPOCHS = 100
+MIN_EPOCHS = 20
+PATIENCE = 10
 LEARNING_RATE = 1e-3
+# Fraction of the training nodes held out for early stopping
+VAL_FRACTION = 0.2
 
 
 def visualize(h, color, name: str):
@@ -54,16 +61,11 @@ def visualize(h, color, name: str):
 
 
 def read_edgelist_deltas(arq_deltas: str) -> Dict[tuple, float]:
-    deltas = open(arq_deltas, "r")
-    lin_deltas = ""
-    delta_dict: Dict[tuple, float] = {}
-    while True:
-        lin_deltas = deltas.readline()
-        if len(lin_deltas) == 0:
-            break
-        src, dst, delta = lin_deltas.split(",")
-        delta_dict[(src, dst)] = float(delta)
-    return delta_dict
+    src, dst, delta = read_criticality(arq_deltas)
+    return {
+        (str(u), str(v)): d
+        for u, v, d in zip(src.tolist(), dst.tolist(), delta.tolist())
+    }
 
 
 def generate_labels(deltas: Dict[tuple, float]) -> Dict[tuple, float]:
@@ -115,19 +117,29 @@ def split_nodes(train_split: float, deltas: Dict[int, float]):
     num_train_elements = round(train_split * len(valid_nodes))
     nodes_for_split = np.array(valid_nodes)
     np.random.shuffle(nodes_for_split)
-    train_nodes = nodes_for_split[:num_train_elements]
+    # At least one training node is left after the validation ones
+    num_train_elements = max(2, num_train_elements)
+    num_val_elements = min(
+        max(1, round(VAL_FRACTION * num_train_elements)),
+        num_train_elements - 1,
+    )
+    val_nodes = nodes_for_split[:num_val_elements]
+    train_nodes = nodes_for_split[num_val_elements:num_train_elements]
     test_nodes = nodes_for_split[num_train_elements:]
-    return train_nodes, test_nodes
+    return train_nodes, val_nodes, test_nodes
 
 
 def create_torch_data(
     Gl: nx.Graph,
+    adj_t: torch.Tensor,
     train_nodes: List[int],
+    val_nodes: List[int],
     test_nodes: List[int],
     embedding_dimension: int,
 ) -> Data:
     Gn: nx.Graph = nx.convert_node_labels_to_integers(Gl)
     data = from_networkx(Gn)
+    data.adj_t = adj_t
 
     # Embedding dimension
     n = Gn.number_of_nodes()
@@ -136,10 +148,13 @@ def create_torch_data(
     data.x = torch.from_numpy(np.random.rand(n, d).astype(np.float32))
 
     # Add labels and masks to data object
-    train_mask = np.zeros((n,), dtype=np.bool8)
-    test_mask = np.zeros((n,), dtype=np.bool8)
+    train_mask = np.zeros((n,), dtype=bool)
+    val_mask = np.zeros((n,), dtype=bool)
+    test_mask = np.zeros((n,), dtype=bool)
     for k in train_nodes:
         train_mask[k] = True
+    for k in val_nodes:
+        val_mask[k] = True
     for k in test_nodes:
         test_mask[k] = True
 
@@ -148,6 +163,7 @@ def create_torch_data(
         y[i] = v
 
     data.train_mask = torch.from_numpy(train_mask)
+    data.val_mask = torch.from_numpy(val_mask)
     data.test_mask = torch.from_numpy(test_mask)
     data.y = torch.from_numpy(y.astype(np.float32))
     return data
@@ -161,15 +177,15 @@ class GCN(torch.nn.Module):
         num_outputs: int,
     ):
         super().__init__()
-        self.conv1 = GCNConv(num_inputs, hidden_channels)
-        self.conv2 = GCNConv(hidden_channels, hidden_channels)
+        self.conv1 = GCNConv(num_inputs, hidden_channels, normalize=False)
+        self.conv2 = GCNConv(hidden_channels, hidden_channels, normalize=False)
         self.linear1 = Linear(hidden_channels, 4)
         self.linear2 = Linear(4, num_outputs)
 
-    def forward(self, x, edge_index):
-        x = self.conv1(x, edge_index)
+    def forward(self, x, adj_t):
+        x = self.conv1(x, adj_t)
         x = x.relu()
-        x = self.conv2(x, edge_index)
+        x = self.conv2(x, adj_t)
         x = x.relu()
         x = self.linear1(x)
         x = self.linear2(x)
@@ -184,18 +200,27 @@ def train(
 ):
     model.train()
     optimizer.zero_grad()  # Clear gradients.
-    out = model(data.x, data.edge_index)  # Perform a single forward pass.
+    out = model(data.x, data.adj_t)  # Perform a single forward pass.
     loss = criterion(
         out[data.train_mask], data.y[data.train_mask].unsqueeze(1)
     )  # Compute the loss solely based on the training nodes.
     loss.backward()  # Derive gradients.
     optimizer.step()  # Update parameters based on gradients.
-    return loss
+
+    # The validation loss is that of the updated weights, without dropout
+    model.eval()
+    with torch.no_grad():
+        out = model(data.x, data.adj_t)
+        val_loss = criterion(
+            out[data.val_mask], data.y[data.val_mask].unsqueeze(1)
+        )
+
+    return loss.item(), val_loss.item()
 
 
 def test(model: GCN, data: Data) -> np.ndarray:
     model.eval()
-    out = model(data.x, data.edge_index)
+    out = model(data.x, data.adj_t)
     # Use the class with highest probability.
     y = np.array(data.y[data.test_mask])
     yhat = out[data.test_mask].detach().numpy()
@@ -208,11 +233,13 @@ def process_test_results(
     embedding_d: int,
     channels: int,
     train_split: int,
+    num_epochs: int,
 ):
     result_dict: Dict[str, list] = {
         "embedding_d": [embedding_d],
         "channels": [channels],
         "train_split": [train_split],
+        "num_epochs": [num_epochs],
         "mse": [mean_squared_error(y, y_hat)],
         "mae": [mean_absolute_error(y, y_hat)],
         "r2": [r2_score(y, y_hat)],
@@ -222,6 +249,12 @@ def process_test_results(
 
 combinations = list(product(K, EMBEDDING_D, TRAIN_SPLIT, CHANNELS))
 G = nx.read_edgelist(EDGELIST)
+# Every eval trains on the same line graph, normalized only once
+Gl = nx.line_graph(G)
+adj_t = normalized_adjacency(
+    from_networkx(nx.convert_node_labels_to_integers(Gl)).edge_index,
+    Gl.number_of_nodes(),
+)
 result = pd.DataFrame()
 for c in combinations:
     k, embedding_d, train_split, channels = c
@@ -235,11 +268,16 @@ for c in combinations:
             f"k{k}_emb{embedding_d}_"
             + f"split{train_split}_channels{channels}_it{i}"
         )
-        Gl = nx.line_graph(G)
         classes_relabel, nodes = canonical_relabeling(Gl, classes)
 
-        train_nodes, test_nodes = split_nodes(train_split, classes_relabel)
-        data = create_torch_data(Gl, train_nodes, test_nodes, embedding_d)
+        # Early stopping looks at the validation nodes, taken out of the
+        # training ones, and the test nodes are only used for scoring
+        train_nodes, val_nodes, test_nodes = split_nodes(
+            train_split, classes_relabel
+        )
+        data = create_torch_data(
+            Gl, adj_t, train_nodes, val_nodes, test_nodes, embedding_d
+        )
 
         model = GCN(
             num_inputs=data.num_features,
@@ -250,10 +288,16 @@ for c in combinations:
             model.parameters(), lr=LEARNING_RATE, weight_decay=5e-4
         )
         criterion = torch.nn.MSELoss()
+        stopping = EarlyStopping(
+            model, patience=PATIENCE, min_epochs=MIN_EPOCHS
+        )
         for epoch in range(1, NUM_EPOCHS + 1):
-            loss = train(model, data, optimizer, criterion)
+            loss, val_loss = train(model, data, optimizer, criterion)
             if epoch % 100 == 0:
                 print(f"Epoch: {epoch:03d}, Loss: {loss:.4f}")
+            if stopping.step(epoch, val_loss):
+                break
+        stopping.restore()
 
         y, y_hat = test(model, data)
         r = process_test_results(
@@ -262,6 +306,7 @@ for c in combinations:
             embedding_d,
             channels,
             train_split,
+            stopping.epochs[0],
         )
         if result.empty:
             result = r
@@ -0,0 +1,122 @@
+import networkx as nx
+import numpy as np
+import torch
+from os import getenv
+from os.path import join
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Tuple
+from dotenv import load_dotenv
+
+from refactor.approaches.artifact import CLGArtifact, INFERENCE_BACKENDS
+from refactor.approaches.clg import CLG, train
+from refactor.approaches.labeling import QuantileLabeling
+from refactor.approaches.preprocessing import Preprocessing
+from refactor.utils.files import edgelist_file, criticality_file
+
+torch.manual_seed(0)
+np.random.seed(0)
+
+load_dotenv(override=True)
+
+# Cold start and steady state CPU latency of scoring a graph with a
+# saved CLG artifact, for each inference backend. The artifact is
+# trained on GRAPHNAME and scores every graph of GRAPHS.
+GRAPHNAME = getenv("GRAPHNAME")
+GRAPHS = ["ieee39", "ieee118", "ieee300"]
+EDGELIST_BASEDIR = getenv("EDGELIST_BASEDIR")
+CRITICALITY_BASEDIR = getenv("CRITICALITY_BASEDIR")
+K = [int(k) for k in getenv("K").split(",") if len(k) > 0]
+CRITICALITY = criticality_file(CRITICALITY_BASEDIR, GRAPHNAME, K[0])
+TOL = 0.25
+TRAIN_SPLIT = 0.3
+N_REPETITIONS = 50
+
+NUM_EPOCHS = 200
+LEARNING_RATE = 1e-3
+EMBEDDING_D = 32
+DROPOUT = 0.5
+HIDDEN_CHANNELS = 16
+FEATURE_SEED = 0
+
+
+def trained_artifact() -> CLGArtifact:
+    labeling_strategy = QuantileLabeling(TOL)
+    preprocessor = Preprocessing(
+        nx.read_edgelist(edgelist_file(EDGELIST_BASEDIR, GRAPHNAME)),
+        CRITICALITY,
+        train_split=TRAIN_SPLIT,
+        embedding_dimension=EMBEDDING_D,
+        labeling_strategy=labeling_strategy,
+        feature_seed=FEATURE_SEED,
+    )
+    data = preprocessor.torch_node_data
+    model = CLG(
+        num_inputs=data.num_features,
+        hidden_channels=HIDDEN_CHANNELS,
+        num_outputs=data.num_classes,
+        dropout=DROPOUT,
+    )
+    optimizer = torch.optim.Adam(
+        model.parameters(), lr=LEARNING_RATE, weight_decay=1e-3
+    )
+    criterion = torch.nn.CrossEntropyLoss()
+    for _ in range(NUM_EPOCHS):
+        train(model, data, optimizer, criterion)
+    return CLGArtifact(model, K[0], labeling_strategy, FEATURE_SEED)
+
+
+def score(
+    artifact: CLGArtifact, module: torch.nn.Module, graph: nx.Graph
+) -> torch.Tensor:
+    x, adj_t = artifact.inputs(graph)
+    with torch.no_grad():
+        return module(x, adj_t)
+
+
+def cold(
+    filename: str, backend: str, graph: nx.Graph
+) -> Tuple[float, torch.Tensor]:
+    # Loading the artifact, building the module and scoring once
+    torch._dynamo.reset()
+    begin = perf_counter()
+    artifact = CLGArtifact.load(filename)
+    out = score(artifact, artifact.inference_module(backend), graph)
+    return perf_counter() - begin, out
+
+
+def steady(filename: str, backend: str, graph: nx.Graph) -> float:
+    artifact = CLGArtifact.load(filename)
+    module = artifact.inference_module(backend)
+    for _ in range(3):
+        score(artifact, module, graph)
+    times = []
+    for _ in range(N_REPETITIONS):
+        begin = perf_counter()
+        score(artifact, module, graph)
+        times.append(perf_counter() - begin)
+    return float(np.median(times))
+
+
+graphs = {
+    name: nx.read_edgelist(edgelist_file(EDGELIST_BASEDIR, name))
+    for name in GRAPHS
+}
+print(f"Trained on {GRAPHNAME} k={K[0]} quantile={TOL}")
+with TemporaryDirectory() as tmp:
+    filename = join(tmp, "clg.pt")
+    trained_artifact().save(filename)
+    for name, graph in graphs.items():
+        reference = None
+        for backend in INFERENCE_BACKENDS:
+            cold_time, out = cold(filename, backend, graph)
+            if reference is None:
+                reference = out
+            error = (out - reference).abs().max().item()
+            steady_time = steady(filename, backend, graph)
+            print(
+                f"{name:>8} ({graph.number_of_edges():4d} edges) "
+                + f"{backend:>7}: {cold_time * 1e3:8.1f} ms cold, "
+                + f"{steady_time * 1e3:6.2f} ms steady, "
+                + f"max |diff| {error:.1e}"
+            )
@@ -0,0 +1,139 @@
+import networkx as nx
+import numpy as np
+import torch
+from os import getenv
+from time import perf_counter
+from typing import Callable, Tuple
+from dotenv import load_dotenv
+from torch.profiler import ProfilerActivity, profile
+from torch_geometric.data import Data
+
+from refactor.approaches import clg, edge_gcn
+from refactor.approaches.labeling import QuantileLabeling
+from refactor.approaches.postprocessing import Postprocessing
+from refactor.approaches.preprocessing import Preprocessing
+from refactor.utils.files import edgelist_file, criticality_file
+
+torch.manual_seed(0)
+np.random.seed(0)
+
+load_dotenv(override=True)
+
+# Compares CLG, with message passing on the line graph, with EdgeGCN,
+# with message passing on the graph itself, on the same labels and
+# splits: training time, AUC and the peak memory of a training step
+GRAPHNAME = getenv("GRAPHNAME")
+EDGELIST_BASEDIR = getenv("EDGELIST_BASEDIR")
+CRITICALITY_BASEDIR = getenv("CRITICALITY_BASEDIR")
+K = [int(k) for k in getenv("K").split(",") if len(k) > 0]
+EDGELIST = edgelist_file(EDGELIST_BASEDIR, GRAPHNAME)
+CRITICALITY = criticality_file(CRITICALITY_BASEDIR, GRAPHNAME, K[0])
+TOL = 0.25
+TRAIN_SPLIT = 0.3
+N_EVALS = 10
+
+NUM_EPOCHS = 500
+LEARNING_RATE = 1e-3
+EMBEDDING_D = 32
+DROPOUT = 0.5
+HIDDEN_CHANNELS = 16
+
+Train = Callable[..., Tuple[float, float]]
+Test = Callable[..., Tuple[torch.Tensor, torch.Tensor]]
+
+
+def peak_memory(step: Callable[[], None]) -> int:
+    # Peak of the CPU memory allocated by the tensors of one step, as
+    # the running sum of the memory each op allocates and frees itself.
+    # Memory freed within the op that allocated it is not counted, so
+    # it is a lower bound of the peak at the resolution of single ops.
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as p:
+        step()
+    events = sorted(p.events(), key=lambda e: e.time_range.start)
+    allocated = np.cumsum([e.self_cpu_memory_usage for e in events])
+    return int(max(allocated.max(), 0)) if len(allocated) > 0 else 0
+
+
+def run(
+    model: torch.nn.Module, data: Data, train: Train, test: Test
+) -> Tuple[float, float, int]:
+    optimizer = torch.optim.Adam(
+        model.parameters(), lr=LEARNING_RATE, weight_decay=1e-3
+    )
+    criterion = torch.nn.CrossEntropyLoss()
+    memory = peak_memory(lambda: train(model, data, optimizer, criterion))
+    begin = perf_counter()
+    train_losses = []
+    val_losses = []
+    for _ in range(NUM_EPOCHS - 1):
+        train_loss, val_loss = train(model, data, optimizer, criterion)
+        train_losses.append(train_loss)
+        val_losses.append(val_loss)
+    y, yhat = test(model, data)
+    elapsed = perf_counter() - begin
+    postprocessor = Postprocessing(
+        y,
+        yhat,
+        np.array(train_losses),
+        np.array(val_losses),
+        K[0],
+        TRAIN_SPLIT,
+        labeling_strategy,
+    )
+    return elapsed, postprocessor.auc, memory
+
+
+G = nx.read_edgelist(EDGELIST)
+labeling_strategy = QuantileLabeling(TOL)
+preprocessor = Preprocessing(
+    G,
+    CRITICALITY,
+    train_split=TRAIN_SPLIT,
+    embedding_dimension=EMBEDDING_D,
+    labeling_strategy=labeling_strategy,
+)
+line_graph_data = preprocessor.torch_node_data
+graph_data = preprocessor.torch_edge_data
+train_masks, val_masks, test_masks = preprocessor.train_val_test_masks(N_EVALS)
+
+results = {"CLG": [], "EdgeGCN": []}
+for i in range(N_EVALS):
+    for data in [line_graph_data, graph_data]:
+        data.train_mask = train_masks[i]
+        data.val_mask = val_masks[i]
+        data.test_mask = test_masks[i]
+    model = clg.CLG(
+        num_inputs=line_graph_data.num_features,
+        hidden_channels=HIDDEN_CHANNELS,
+        num_outputs=line_graph_data.num_classes,
+        dropout=DROPOUT,
+    )
+    results["CLG"].append(run(model, line_graph_data, clg.train, clg.test))
+    model = edge_gcn.EdgeGCN(
+        num_inputs=graph_data.num_features,
+        hidden_channels=HIDDEN_CHANNELS,
+        num_edge_features=graph_data.edge_features.shape[1],
+        num_outputs=graph_data.num_classes,
+        dropout=DROPOUT,
+    )
+    results["EdgeGCN"].append(
+        run(model, graph_data, edge_gcn.train, edge_gcn.test)
+    )
+
+nnz = {
+    "CLG": line_graph_data.adj_t.values().numel(),
+    "EdgeGCN": graph_data.adj_t.values().numel(),
+}
+reference = np.mean([t for t, _, _ in results["CLG"]])
+print(f"{GRAPHNAME} k={K[0]} quantile={TOL} split={TRAIN_SPLIT}")
+for name, values in results.items():
+    times = np.array([t for t, _, _ in values])
+    aucs = np.array([a for _, a, _ in values])
+    memory = np.max([m for _, _, m in values])
+    print(
+        f"{name:>7}: {times.mean():7.3f} s/eval "
+        + f"({reference / times.mean():5.1f}x), "
+        + f"AUC {aucs.mean():.3f} +- {aucs.std():.3f}, "
+        + f"peak {memory / 2 ** 20:7.2f} MiB/step, "
+        + f"{nnz[name]} adjacency entries"
+    )
@@ -0,0 +1,129 @@
+import networkx as nx
+import numpy as np
+import torch
+from os import getenv
+from os.path import join
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Dict, List, Tuple
+from dotenv import load_dotenv
+
+from contingency.controllers.gnn_screener import GNNScreener
+from contingency.controllers.screener import ExhaustiveScreener
+from contingency.models.network import Network
+from refactor.approaches.artifact import CLGArtifact
+from refactor.approaches.clg import CLG, train
+from refactor.approaches.labeling import QuantileLabeling
+from refactor.approaches.preprocessing import Preprocessing
+from refactor.utils.files import edgelist_file, criticality_file
+
+torch.manual_seed(0)
+np.random.seed(0)
+
+load_dotenv(override=True)
+
+# Compares the latency of GNNScreener, loading a CLG trained on the
+# exhaustive criticalities of the train edges of the graph, with
+# ExhaustiveScreener, and the precision of its top N held out test edges
+# against the exhaustive ranking of the same edges
+GRAPHNAME = getenv("GRAPHNAME")
+EDGELIST_BASEDIR = getenv("EDGELIST_BASEDIR")
+CRITICALITY_BASEDIR = getenv("CRITICALITY_BASEDIR")
+K = [int(k) for k in getenv("K").split(",") if len(k) > 0]
+EDGELIST = edgelist_file(EDGELIST_BASEDIR, GRAPHNAME)
+CRITICALITY = criticality_file(CRITICALITY_BASEDIR, GRAPHNAME, K[0])
+TOL = 0.25
+TRAIN_SPLIT = 0.3
+TOP_N = [5, 10, 20]
+N_REPETITIONS = 10
+NUM_PROCESSORS = int(getenv("NUM_WORKERS", "1"))
+
+NUM_EPOCHS = 500
+LEARNING_RATE = 1e-3
+EMBEDDING_D = 32
+DROPOUT = 0.5
+HIDDEN_CHANNELS = 16
+FEATURE_SEED = 0
+
+
+def trained_clg(preprocessor: Preprocessing) -> CLG:
+    data = preprocessor.torch_node_data
+    model = CLG(
+        num_inputs=data.num_features,
+        hidden_channels=HIDDEN_CHANNELS,
+        num_outputs=data.num_classes,
+        dropout=DROPOUT,
+    )
+    optimizer = torch.optim.Adam(
+        model.parameters(), lr=LEARNING_RATE, weight_decay=1e-3
+    )
+    criterion = torch.nn.CrossEntropyLoss()
+    for _ in range(NUM_EPOCHS):
+        train(model, data, optimizer, criterion)
+    return model
+
+
+def top_edges(
+    scores: Dict[Tuple[str, str], float], edges: List, n: int
+) -> List:
+    return sorted(edges, key=scores.get, reverse=True)[:n]
+
+
+G = nx.read_edgelist(EDGELIST)
+labeling_strategy = QuantileLabeling(TOL)
+# Seeded features, the same ones GNNScreener builds at inference
+preprocessor = Preprocessing(
+    G,
+    CRITICALITY,
+    train_split=TRAIN_SPLIT,
+    embedding_dimension=EMBEDDING_D,
+    labeling_strategy=labeling_strategy,
+    feature_seed=FEATURE_SEED,
+)
+artifact = CLGArtifact(
+    trained_clg(preprocessor), K[0], labeling_strategy, FEATURE_SEED
+)
+
+network = Network.from_edgelist(EDGELIST)
+begin = perf_counter()
+exhaustive = ExhaustiveScreener(network, NUM_PROCESSORS).global_deltas(K[0])
+exhaustive_time = perf_counter() - begin
+
+with TemporaryDirectory() as tmp:
+    checkpoint = join(tmp, "clg.pt")
+    artifact.save(checkpoint)
+    # Cold: loading the checkpoint and scoring a network once
+    begin = perf_counter()
+    gnn = GNNScreener.from_checkpoint(
+        network, checkpoint
+    ).critical_probabilities(K[0])
+    cold_time = perf_counter() - begin
+
+# Steady: a compiled module scores a fresh screener of the network
+module = artifact.inference_module()
+steady_times = []
+for _ in range(N_REPETITIONS):
+    begin = perf_counter()
+    GNNScreener(network, artifact, module).scores
+    steady_times.append(perf_counter() - begin)
+steady_time = np.mean(steady_times)
+
+print(f"{GRAPHNAME} k={K[0]} quantile={TOL} split={TRAIN_SPLIT}")
+print(f"Exhaustive: {exhaustive_time * 1e3:9.1f} ms")
+print(
+    f"       GNN: {cold_time * 1e3:9.1f} ms cold, "
+    + f"{steady_time * 1e3:.1f} ms steady "
+    + f"({exhaustive_time / steady_time:.0f}x)"
+)
+# The line graph node k is the edge k of graph.edges, in both graphs
+test_edges = [
+    edge
+    for edge, test in zip(network.graph.edges, preprocessor.masks[2])
+    if test
+]
+print(f"{len(test_edges)} held out test edges")
+for n in TOP_N:
+    hits = set(top_edges(gnn, test_edges, n)) & set(
+        top_edges(exhaustive, test_edges, n)
+    )
+    print(f"precision@{n}: {len(hits) / n:.2f}")
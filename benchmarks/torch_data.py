@@ -0,0 +1,120 @@
+import networkx as nx
+import numpy as np
+import torch
+from os import getenv
+from time import perf_counter
+from typing import Dict, List, Tuple
+from dotenv import load_dotenv
+from torch_geometric.data import Data
+from torch_geometric.utils.convert import from_networkx
+
+from refactor.approaches.context import GraphContext
+from refactor.approaches.labeling import QuantileLabeling
+from refactor.approaches.preprocessing import Preprocessing
+from refactor.utils.files import edgelist_file, criticality_file
+
+load_dotenv(override=True)
+
+# Compares the networkx based construction of the line graph Data
+# with the array based one in Preprocessing.torch_node_data
+GRAPHNAME = "ieee300"
+EDGELIST_BASEDIR = getenv("EDGELIST_BASEDIR")
+CRITICALITY_BASEDIR = getenv("CRITICALITY_BASEDIR")
+K = [int(k) for k in getenv("K").split(",") if len(k) > 0]
+EDGELIST = edgelist_file(EDGELIST_BASEDIR, GRAPHNAME)
+CRITICALITY = criticality_file(CRITICALITY_BASEDIR, GRAPHNAME, K[0])
+TOL = 0.25
+TRAIN_SPLIT = 0.3
+EMBEDDING_D = 256
+N_REPETITIONS = 10
+
+
+def legacy_split(
+    nodes_by_label: Dict[int, np.ndarray],
+) -> Tuple[List[int], List[int]]:
+    # Former per class split of the shuffled nodes, the same number of
+    # training nodes in every class
+    classes = [c for c in nodes_by_label.keys() if c != -1]
+    less_elements = min([len(nodes_by_label[c]) for c in classes])
+    num_train_elements_by_class = max([1, round(TRAIN_SPLIT * less_elements)])
+    train_nodes = []
+    test_nodes = []
+    for c in classes:
+        train_nodes += list(nodes_by_label[c][:num_train_elements_by_class])
+        test_nodes += list(nodes_by_label[c][num_train_elements_by_class:])
+    return train_nodes, test_nodes
+
+
+def networkx_node_data(preprocessor: Preprocessing) -> Data:
+    # Former path: line graph relabeled and converted by from_networkx,
+    # with masks and labels filled element by element
+    Gl = nx.line_graph(preprocessor.graph)
+    Gn: nx.Graph = nx.convert_node_labels_to_integers(Gl)
+    data = from_networkx(Gn)
+    n = Gn.number_of_nodes()
+    d = EMBEDDING_D
+    data.num_features = d
+    data.num_classes = len(preprocessor.nodes_by_label)
+    data.x = torch.from_numpy(np.random.rand(n, d).astype(np.float32))
+    train_mask = np.zeros((n,), dtype=bool)
+    test_mask = np.zeros((n,), dtype=bool)
+    train_nodes, test_nodes = legacy_split(preprocessor.nodes_by_label)
+    for k in train_nodes:
+        train_mask[k] = True
+    for k in test_nodes:
+        test_mask[k] = True
+    y = np.zeros((n,))
+    for c, nodes in preprocessor.nodes_by_label.items():
+        for k in nodes:
+            y[k] = c
+    data.train_mask = torch.from_numpy(train_mask)
+    data.test_mask = torch.from_numpy(test_mask)
+    data.y = torch.from_numpy(y.astype(np.int64))
+    return data
+
+
+def preprocessor(context: GraphContext) -> Preprocessing:
+    return Preprocessing(
+        G,
+        CRITICALITY,
+        train_split=TRAIN_SPLIT,
+        embedding_dimension=EMBEDDING_D,
+        labeling_strategy=QuantileLabeling(TOL),
+        context=context,
+    )
+
+
+def timed(f) -> float:
+    times = []
+    for _ in range(N_REPETITIONS):
+        begin = perf_counter()
+        f()
+        times.append(perf_counter() - begin)
+    return float(np.median(times))
+
+
+G = nx.read_edgelist(EDGELIST)
+shared_context = GraphContext(G)
+preprocessor(shared_context).torch_node_data
+
+results = {
+    "networkx": timed(
+        lambda: networkx_node_data(preprocessor(shared_context))
+    ),
+    "arrays (cold context)": timed(
+        lambda: preprocessor(GraphContext(G)).torch_node_data
+    ),
+    "arrays (shared context)": timed(
+        lambda: preprocessor(shared_context).torch_node_data
+    ),
+}
+data = preprocessor(shared_context).torch_node_data
+print(
+    f"{GRAPHNAME} line graph: {data.num_nodes} nodes, "
+    + f"{data.edge_index.shape[1]} directed edges"
+)
+for name, t in results.items():
+    print(
+        f"{name:>24}: {1e3 * t:8.2f} ms "
+        + f"({results['networkx'] / t:6.1f}x)"
+    )
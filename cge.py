@@ -3,10 +3,9 @@ import pandas as pd
 from itertools import product
 import numpy as np
 import torch
-import random
 from typing import List
-from os import getenv, makedirs
-from os.path import isdir, join
+from os import getenv
+from os.path import join
 from dotenv import load_dotenv
 from refactor.approaches.cge import (
     CGE,
@@ -16,24 +15,33 @@ from refactor.approaches.cge import (
 )
 
 
+from refactor.approaches.context import GraphContext
 from refactor.approaches.labeling import QuantileLabeling
 from refactor.approaches.postprocessing import Postprocessing
 from refactor.approaches.preprocessing import Preprocessing
+from refactor.approaches.sweep import (
+    SweepRunner,
+    Shards,
+    Task,
+    TaskLedger,
+    task_seed,
+)
+from refactor.approaches.training import EarlyStopping
+from refactor.approaches.walks import WalkCorpus
 from refactor.utils.files import (
     edgelist_file,
     criticality_file,
+    criticality_cache_dir,
     class_result_file,
     auc_result_file,
     roc_result_file,
     train_result_file,
-    embeddings_result_file,
+    embeddings_store_dir,
+    columnar_file,
+    sweep_shard_dir,
 )
-
-
-random.seed(0)
-torch.manual_seed(0)
-np.random.seed(0)
-
+from refactor.utils.embedding_store import EmbeddingRuns, EmbeddingStore
+from refactor.utils.reports import ReportWriter
 
 load_dotenv(override=True)
 
@@ -47,10 +55,19 @@ K = [int(k) for k in getenv("K").split(",") if len(k) > 0]
 EDGELIST = edgelist_file(EDGELIST_BASEDIR, GRAPHNAME)
 TOL = [0.10, 0.25, 0.50]
 N_EVALS = 5
+NUM_WORKERS = int(getenv("NUM_WORKERS", "1"))
 
 # Training parameters
 TRAIN_SPLIT = [0.1, 0.3, 0.5]
+# Fraction of the training elements held out for early stopping
+VAL_FRACTION = 0.2
 NUM_EPOCHS = 200
+SNAPSHOT_EPOCHS = [1] + list(range(10, NUM_EPOCHS + 1, 10))
+# The classifier is fitted for the validation loss only on these epochs.
+# The val_loss of the other epochs in the train report is nan.
+VALIDATION_EPOCHS = [1] + list(range(5, NUM_EPOCHS + 1, 5))
+MIN_EPOCHS = 50
+PATIENCE = 20
 LEARNING_RATE = 1e-2
 
 # Model parameters
@@ -61,6 +78,34 @@ WALKS_PER_NODE = 8
 NUMBER_OF_NEGATIVE_SAMPLES = 1
 P = 1
 Q = 1
+# One of refactor.approaches.cge.CLASSIFIERS: svc, logreg, linear_svm, ridge
+CLASSIFIER = "svc"
+# Random walks are sampled once for NUM_EPOCHS epochs, by NUM_WORKERS
+# processes, and shared by all the evals from a memory mapped file under
+# RESULT_BASEDIR/walks. Set to False to sample them on every epoch.
+WALK_CORPUS = True
+
+# Parameters that change the results of a task. Finished tasks are only
+# reused by a sweep with the same ones.
+CONFIG = {
+    "N_EVALS": N_EVALS,
+    "VAL_FRACTION": VAL_FRACTION,
+    "NUM_EPOCHS": NUM_EPOCHS,
+    "SNAPSHOT_EPOCHS": SNAPSHOT_EPOCHS,
+    "VALIDATION_EPOCHS": VALIDATION_EPOCHS,
+    "MIN_EPOCHS": MIN_EPOCHS,
+    "PATIENCE": PATIENCE,
+    "LEARNING_RATE": LEARNING_RATE,
+    "EMBEDDING_D": EMBEDDING_D,
+    "WALK_LENGTH": WALK_LENGTH,
+    "CONTEXT_WINDOW_SIZE": CONTEXT_WINDOW_SIZE,
+    "WALKS_PER_NODE": WALKS_PER_NODE,
+    "NUMBER_OF_NEGATIVE_SAMPLES": NUMBER_OF_NEGATIVE_SAMPLES,
+    "P": P,
+    "Q": Q,
+    "CLASSIFIER": CLASSIFIER,
+    "WALK_CORPUS": WALK_CORPUS,
+}
 
 # IEEE 39
 # EMBEDDING_D = 8
@@ -101,16 +146,33 @@ Q = 1
 # Q = 1
 
 G = nx.read_edgelist(EDGELIST)
+# The parsed criticality files are cached next to the results of
+# every approach, not in CRITICALITY_BASEDIR
+context = GraphContext(
+    G,
+    [QuantileLabeling(tol) for tol in TOL],
+    cache_dir=criticality_cache_dir(getenv("RESULT_BASEDIR")),
+)
 combinations = list(product(K, TOL, TRAIN_SPLIT))
+corpus = (
+    WalkCorpus(
+        context.edge_index,
+        G.number_of_nodes(),
+        walk_length=WALK_LENGTH,
+        walks_per_node=WALKS_PER_NODE,
+        p=P,
+        q=Q,
+        num_epochs=NUM_EPOCHS,
+        directory=RESULT_BASEDIR,
+        num_workers=NUM_WORKERS,
+    )
+    if WALK_CORPUS
+    else None
+)
 
-train_result = pd.DataFrame()
-embeddings_result = pd.DataFrame()
-class_result = pd.DataFrame()
-auc_result = pd.DataFrame()
-roc_result = pd.DataFrame()
 
-for c in combinations:
-    k, tol, train_split = c
+def run_eval(task: Task) -> Shards:
+    k, tol, train_split, i = task
     CRITICALITY = criticality_file(CRITICALITY_BASEDIR, GRAPHNAME, k)
     labeling_strategy = QuantileLabeling(tol)
     preprocessor = Preprocessing(
@@ -119,90 +181,138 @@ for c in combinations:
         train_split=train_split,
         embedding_dimension=EMBEDDING_D,
         labeling_strategy=labeling_strategy,
+        context=context,
     )
-    print(f"Params = {c}")
-    for i in range(1, N_EVALS + 1):
-        print(f"Eval {i}")
-        name = f"k{k}_split{train_split}_it{i}"
-        data = preprocessor.torch_edge_data
-
-        model = CGE(
-            data=data,
-            embedding_dimension=EMBEDDING_D,
-            walk_length=WALK_LENGTH,
-            context_window_size=CONTEXT_WINDOW_SIZE,
-            walks_per_node=WALKS_PER_NODE,
-            number_of_negative_samples=NUMBER_OF_NEGATIVE_SAMPLES,
-            p=P,
-            q=Q,
-        )
+    print(f"Params = {(k, tol, train_split)}, Eval {i}")
+    # The masks of every eval of a combination come from its own seed
+    # and the validation edges, for early stopping, are taken out of the
+    # training ones. The test edges are only used for scoring.
+    train_masks, val_masks, test_masks = preprocessor.train_val_test_masks(
+        N_EVALS,
+        seed=task_seed((k, tol, train_split, 0)),
+        val_fraction=VAL_FRACTION,
+    )
+    data = preprocessor.torch_edge_data
 
-        optimizer = torch.optim.SparseAdam(
-            list(model.embedding_model.parameters()), lr=LEARNING_RATE
-        )
+    model = CGE(
+        data=data,
+        embedding_dimension=EMBEDDING_D,
+        walk_length=WALK_LENGTH,
+        context_window_size=CONTEXT_WINDOW_SIZE,
+        walks_per_node=WALKS_PER_NODE,
+        number_of_negative_samples=NUMBER_OF_NEGATIVE_SAMPLES,
+        p=P,
+        q=Q,
+        classifier=CLASSIFIER,
+    )
 
-        train_losses: List[float] = []
-        val_losses: List[float] = []
-        embeddings_c = pd.DataFrame()
-        train_edges, test_edges = preprocessor.train_test_edges
-        edges_labels = preprocessor.edges_labels
-        edges_by_label = preprocessor.edges_by_label
-        for epoch in range(1, NUM_EPOCHS + 1):
-            train_loss, val_loss = train_embedding(
-                model, data, optimizer, train_edges, test_edges, edges_labels
-            )
-            train_losses.append(train_loss)
-            val_losses.append(val_loss)
-            if epoch % 10 == 0 or epoch == 1:
-                print(
-                    f"Epoch: {epoch:03d}, Train Loss: {train_loss:.4f},  Val Loss: {val_loss:.4f}"
-                )
-                df_embeddings = model.edge_embeddings_with_labels(
-                    edges_by_label
-                )
-                df_embeddings["epoch"] = epoch
-                embeddings_c = pd.concat(
-                    [embeddings_c, df_embeddings], ignore_index=True
-                )
-
-        train_classification(model, train_edges, edges_labels)
-
-        y, yhat = test(model, test_edges, edges_labels)
-        postprocessor = Postprocessing(
-            y,
-            yhat,
-            train_losses,
-            val_losses,
-            k,
-            train_split,
-            labeling_strategy,
-            eval=i,
-        )
-        embeddings_c["k"] = k
-        embeddings_c["tol"] = tol
-        embeddings_c["train_split"] = train_split
-        embeddings_c["eval"] = i
+    optimizer = torch.optim.SparseAdam(
+        list(model.embedding_model.parameters()), lr=LEARNING_RATE
+    )
 
-        embeddings_result = Postprocessing.update_report(
-            embeddings_result, embeddings_c
-        )
-        train_result = Postprocessing.update_report(
-            train_result, postprocessor.train_report()
-        )
-        class_result = Postprocessing.update_report(
-            class_result, postprocessor.classes_report()
-        )
-        auc_result = Postprocessing.update_report(
-            auc_result, postprocessor.auc_report()
-        )
-        roc_result = Postprocessing.update_report(
-            roc_result, postprocessor.roc_report()
+    train_losses: List[float] = []
+    val_losses: List[float] = []
+    snapshots: List[np.ndarray] = []
+    snapshot_epochs: List[int] = []
+    train_edges = preprocessor.edges[train_masks[i - 1].numpy()]
+    val_edges = preprocessor.edges[val_masks[i - 1].numpy()]
+    test_edges = preprocessor.edges[test_masks[i - 1].numpy()]
+    edges_labels = preprocessor.edges_labels
+    stopping = EarlyStopping(
+        model.embedding_model, patience=PATIENCE, min_epochs=MIN_EPOCHS
+    )
+    for epoch in range(1, NUM_EPOCHS + 1):
+        validate = epoch in VALIDATION_EPOCHS
+        train_loss, val_loss = train_embedding(
+            model,
+            data,
+            optimizer,
+            train_edges,
+            val_edges,
+            edges_labels,
+            validate=validate,
+            walks=None if corpus is None else corpus.epoch(epoch),
         )
+        train_losses.append(train_loss)
+        val_losses.append(val_loss)
+        if epoch in SNAPSHOT_EPOCHS:
+            print(
+                f"Epoch: {epoch:03d}, Train Loss: {train_loss:.4f},  Val Loss: {val_loss:.4f}"
+            )
+            snapshots.append(model.edge_embeddings_array(preprocessor.edges))
+            snapshot_epochs.append(epoch)
+        if validate and stopping.step(epoch, val_loss):
+            print(f"Stopped at epoch {epoch:03d}")
+            break
+    stopping.restore()
+
+    train_classification(model, train_edges, edges_labels)
 
-if not isdir(RESULT_BASEDIR):
-    makedirs(RESULT_BASEDIR)
-embeddings_result.to_csv(embeddings_result_file(RESULT_BASEDIR, GRAPHNAME))
-train_result.to_csv(train_result_file(RESULT_BASEDIR, GRAPHNAME))
-class_result.to_csv(class_result_file(RESULT_BASEDIR, GRAPHNAME))
-auc_result.to_csv(auc_result_file(RESULT_BASEDIR, GRAPHNAME))
-roc_result.to_csv(roc_result_file(RESULT_BASEDIR, GRAPHNAME))
+    y, yhat = test(model, test_edges, edges_labels)
+    postprocessor = Postprocessing(
+        y,
+        yhat,
+        train_losses,
+        val_losses,
+        k,
+        train_split,
+        labeling_strategy,
+        eval=i,
+        best_epoch=stopping.best_epochs[0],
+    )
+    embeddings = EmbeddingRuns(
+        pd.DataFrame(
+            {"k": [k], "tol": [tol], "train_split": [train_split], "eval": [i]}
+        ),
+        np.array([snapshot_epochs]),
+        preprocessor.labels[None, :],
+        np.stack(snapshots)[None],
+    )
+    return {
+        "embeddings": embeddings,
+        "train": postprocessor.train_report(),
+        "class": postprocessor.classes_report(),
+        "auc": postprocessor.auc_report(),
+        "roc": postprocessor.roc_report(),
+    }
+
+
+if __name__ == "__main__":
+    # Sampled before the sweep, whose workers cannot start processes
+    if corpus is not None:
+        corpus.walks
+    # Finished tasks are kept in the shard directory, so that an
+    # interrupted sweep resumes where it stopped. Remove it to start over.
+    runner = SweepRunner(
+        run_eval,
+        num_workers=NUM_WORKERS,
+        ledger=TaskLedger(sweep_shard_dir(RESULT_BASEDIR, GRAPHNAME), CONFIG),
+    )
+    tasks = [
+        (k, tol, split, i)
+        for k, tol, split in combinations
+        for i in range(1, N_EVALS + 1)
+    ]
+
+    # Reports are streamed to Parquet files next to the former csv ones,
+    # and the embedding snapshots to a binary store
+    reports = {
+        "train": train_result_file(RESULT_BASEDIR, GRAPHNAME),
+        "class": class_result_file(RESULT_BASEDIR, GRAPHNAME),
+        "auc": auc_result_file(RESULT_BASEDIR, GRAPHNAME),
+        "roc": roc_result_file(RESULT_BASEDIR, GRAPHNAME),
+    }
+    store_shape = (
+        len(tasks),
+        len(SNAPSHOT_EPOCHS),
+        G.number_of_edges(),
+        EMBEDDING_D,
+    )
+    with ReportWriter(
+        {name: columnar_file(f) for name, f in reports.items()}
+    ) as writer, EmbeddingStore(
+        embeddings_store_dir(RESULT_BASEDIR, GRAPHNAME), store_shape
+    ) as store:
+        for shards in runner.run(tasks):
+            store.append(shards.pop("embeddings"))
+            writer.write(shards)
@@ -2,31 +2,50 @@ import networkx as nx
 import pandas as pd
 from itertools import product
 import torch
-import random
 import numpy as np
 from os import getenv, makedirs
-from os.path import isdir, join
+from os.path import dirname, join
 from dotenv import load_dotenv
-from typing import List
+from typing import Dict, List
 
 
+from refactor.approaches.artifact import CLGArtifact
+from refactor.approaches.clustering import ClusterBatches
+from refactor.approaches.context import GraphContext
 from refactor.approaches.labeling import QuantileLabeling
 from refactor.approaches.postprocessing import Postprocessing
 from refactor.approaches.preprocessing import Preprocessing
-from refactor.approaches.clg import CLG, train, test
+from refactor.approaches.sweep import (
+    SweepRunner,
+    Shards,
+    Task,
+    TaskLedger,
+    task_seed,
+)
+from refactor.approaches.training import EarlyStopping
+from refactor.approaches.clg import (
+    CLG,
+    BatchedCLG,
+    EmbeddingSnapshots,
+    train_batched,
+    train_batched_clusters,
+    test_batched,
+)
 from refactor.utils.files import (
     edgelist_file,
     criticality_file,
+    criticality_cache_dir,
     class_result_file,
     auc_result_file,
     roc_result_file,
     train_result_file,
-    embeddings_result_file,
+    embeddings_store_dir,
+    model_artifact_file,
+    columnar_file,
+    sweep_shard_dir,
 )
-
-random.seed(0)
-torch.manual_seed(0)
-np.random.seed(0)
+from refactor.utils.embedding_store import EmbeddingRuns, EmbeddingStore
+from refactor.utils.reports import ReportWriter
 
 load_dotenv(override=True)
 
@@ -40,17 +59,54 @@ K = [int(k) for k in getenv("K").split(",") if len(k) > 0]
 EDGELIST = edgelist_file(EDGELIST_BASEDIR, GRAPHNAME)
 TOL = [0.10, 0.25, 0.50]
 N_EVALS = 30
+NUM_WORKERS = int(getenv("NUM_WORKERS", "1"))
 
 # Training parameters
 TRAIN_SPLIT = [0.1, 0.3, 0.5]
+# Fraction of the training elements held out for early stopping
+VAL_FRACTION = 0.2
 NUM_EPOCHS = 500
+SNAPSHOT_EPOCHS = [1] + list(range(100, NUM_EPOCHS + 1, 100))
+MIN_EPOCHS = 100
+PATIENCE = 50
 LEARNING_RATE = 1e-3
 
+# Cluster-GCN training for line graphs too large for a full batch: the
+# line graph is split in NUM_PARTS clusters, each step trains on the
+# subgraph of CLUSTERS_PER_BATCH of them, and the evaluation runs layer
+# by layer, INFERENCE_BATCH_SIZE rows at a time. NUM_PARTS = 0 trains
+# on the whole line graph.
+NUM_PARTS = 0
+CLUSTERS_PER_BATCH = 2
+PARTITION_METHOD = "greedy"
+INFERENCE_BATCH_SIZE = 4096
+
 # Model parameters
 EMBEDDING_D = 32
+FEATURE_SEED = 0
 DROPOUT = 0.5
 HIDDEN_CHANNELS = 16
 
+# Parameters that change the results of a task. Finished tasks are only
+# reused by a sweep with the same ones.
+CONFIG = {
+    "N_EVALS": N_EVALS,
+    "VAL_FRACTION": VAL_FRACTION,
+    "NUM_EPOCHS": NUM_EPOCHS,
+    "SNAPSHOT_EPOCHS": SNAPSHOT_EPOCHS,
+    "MIN_EPOCHS": MIN_EPOCHS,
+    "PATIENCE": PATIENCE,
+    "LEARNING_RATE": LEARNING_RATE,
+    "NUM_PARTS": NUM_PARTS,
+    "CLUSTERS_PER_BATCH": CLUSTERS_PER_BATCH,
+    "PARTITION_METHOD": PARTITION_METHOD,
+    "INFERENCE_BATCH_SIZE": INFERENCE_BATCH_SIZE,
+    "EMBEDDING_D": EMBEDDING_D,
+    "FEATURE_SEED": FEATURE_SEED,
+    "DROPOUT": DROPOUT,
+    "HIDDEN_CHANNELS": HIDDEN_CHANNELS,
+}
+
 # IEEE 39-
 # NUM_EPOCHS = 500
 # EMBEDDING_D = 32
@@ -76,16 +132,27 @@ HIDDEN_CHANNELS = 16
 # HIDDEN_CHANNELS = 64
 
 G = nx.read_edgelist(EDGELIST)
+# The parsed criticality files are cached next to the results of
+# every approach, not in CRITICALITY_BASEDIR
+context = GraphContext(
+    G,
+    [QuantileLabeling(tol) for tol in TOL],
+    cache_dir=criticality_cache_dir(getenv("RESULT_BASEDIR")),
+)
 combinations = list(product(K, TOL, TRAIN_SPLIT))
 
-train_result = pd.DataFrame()
-embeddings_result = pd.DataFrame()
-class_result = pd.DataFrame()
-auc_result = pd.DataFrame()
-roc_result = pd.DataFrame()
 
-for c in combinations:
-    k, tol, train_split = c
+def run_combination(task: Task) -> Shards:
+    # The N_EVALS evals of a combination are trained together, so each
+    # task is a whole (k, tol, train_split) combination
+    k, tol, train_split, _ = task
+    reports: Dict[str, List[pd.DataFrame]] = {
+        "train": [],
+        "class": [],
+        "auc": [],
+        "roc": [],
+    }
+
     CRITICALITY = criticality_file(CRITICALITY_BASEDIR, GRAPHNAME, k)
     labeling_strategy = QuantileLabeling(tol)
     preprocessor = Preprocessing(
@@ -94,79 +161,185 @@ for c in combinations:
         train_split=train_split,
         embedding_dimension=EMBEDDING_D,
         labeling_strategy=labeling_strategy,
+        context=context,
+        feature_seed=FEATURE_SEED,
+    )
+    print(f"Params = {(k, tol, train_split)}")
+    # The masks of every eval of a combination come from its own seed
+    # and the validation elements, for early stopping, are taken out of
+    # the training ones. The test elements are only used for scoring.
+    train_masks, val_masks, test_masks = preprocessor.train_val_test_masks(
+        N_EVALS,
+        seed=task_seed((k, tol, train_split, 0)),
+        val_fraction=VAL_FRACTION,
     )
-    print(f"Params = {c}")
+    data = preprocessor.torch_node_data
+
+    # The N_EVALS replicas are trained together, each one with its own
+    # seed and train / validation / test masks
+    replicas = []
     for i in range(1, N_EVALS + 1):
-        print(f"Eval {i}")
-        name = f"k{k}_split{train_split}_it{i}"
-        data = preprocessor.torch_node_data
-
-        model = CLG(
-            num_inputs=data.num_features,
-            hidden_channels=HIDDEN_CHANNELS,
-            num_outputs=data.num_classes,
-            dropout=DROPOUT,
-        )
-        optimizer = torch.optim.Adam(
-            model.parameters(), lr=LEARNING_RATE, weight_decay=1e-3
+        torch.manual_seed(i)
+        replicas.append(
+            CLG(
+                num_inputs=data.num_features,
+                hidden_channels=HIDDEN_CHANNELS,
+                num_outputs=data.num_classes,
+                dropout=DROPOUT,
+            )
         )
-        criterion = torch.nn.CrossEntropyLoss()
-        train_losses: List[float] = []
-        val_losses: List[float] = []
-        embeddings_c = pd.DataFrame()
-        nodes_by_label = preprocessor.nodes_by_label
-        for epoch in range(1, NUM_EPOCHS + 1):
-            train_loss, val_loss = train(model, data, optimizer, criterion)
-            train_losses.append(train_loss)
-            val_losses.append(val_loss)
-            if epoch % 100 == 0 or epoch == 1:
-                print(
-                    f"Epoch: {epoch:03d}, Train Loss: {train_loss:.4f}, Val Loss: {val_loss:.4f}"
-                )
-                df_embeddings = model.node_embeddings_with_labels(
-                    nodes_by_label
-                )
-                df_embeddings["epoch"] = epoch
-                embeddings_c = pd.concat(
-                    [embeddings_c, df_embeddings], ignore_index=True
+    model = BatchedCLG(replicas)
+    optimizer = torch.optim.Adam(
+        model.parameters(), lr=LEARNING_RATE, weight_decay=1e-3
+    )
+    train_losses: List[np.ndarray] = []
+    val_losses: List[np.ndarray] = []
+    snapshots = EmbeddingSnapshots(model, SNAPSHOT_EPOCHS)
+    stopping = EarlyStopping(
+        model, patience=PATIENCE, min_epochs=MIN_EPOCHS, num_runs=N_EVALS
+    )
+    batches = (
+        ClusterBatches(data, NUM_PARTS, CLUSTERS_PER_BATCH, PARTITION_METHOD)
+        if NUM_PARTS > 0
+        else None
+    )
+    for epoch in range(1, NUM_EPOCHS + 1):
+        if batches is None:
+            with snapshots.capture(epoch):
+                train_loss, val_loss = train_batched(
+                    model, data, optimizer, train_masks, val_masks
                 )
+        else:
+            train_loss, val_loss = train_batched_clusters(
+                model,
+                batches,
+                optimizer,
+                train_masks,
+                val_masks,
+                INFERENCE_BATCH_SIZE,
+            )
+            # Snapshots are taken on the whole line graph
+            if epoch in SNAPSHOT_EPOCHS:
+                with snapshots.capture(epoch):
+                    model.inference(data.x, data.adj_t, INFERENCE_BATCH_SIZE)
+        train_losses.append(train_loss)
+        val_losses.append(val_loss)
+        if epoch % 100 == 0 or epoch == 1:
+            print(
+                f"Epoch: {epoch:03d}, Train Loss: {train_loss.mean():.4f}, Val Loss: {val_loss.mean():.4f}"
+            )
+        if stopping.step(epoch, val_loss):
+            print(f"Stopped at epoch {epoch:03d}")
+            break
+    stopping.restore()
+    # The replica kept for inference is the one with the lowest loss of
+    # its restored weights, without dropout, on its validation elements.
+    # The test elements take no part in the choice.
+    inference_batch_size = (
+        INFERENCE_BATCH_SIZE if batches is not None else None
+    )
+    with torch.no_grad():
+        selection_losses = [
+            torch.nn.functional.cross_entropy(out, y).item()
+            for y, out in test_batched(
+                model, data, val_masks, inference_batch_size
+            )
+        ]
+    best_model = model.replica(int(np.argmin(selection_losses)))
+    train_losses = np.stack(train_losses, axis=1)
+    val_losses = np.stack(val_losses, axis=1)
 
-        y, yhat = test(model, data)
+    results = test_batched(
+        model,
+        data,
+        test_masks,
+        inference_batch_size,
+    )
+    for i in range(1, N_EVALS + 1):
+        y, yhat = results[i - 1]
         postprocessor = Postprocessing(
             y,
             yhat,
-            train_losses,
-            val_losses,
+            train_losses[i - 1, : stopping.epochs[i - 1]],
+            val_losses[i - 1, : stopping.epochs[i - 1]],
             k,
             train_split,
             labeling_strategy,
             eval=i,
+            best_epoch=stopping.best_epochs[i - 1],
         )
-        embeddings_c["k"] = k
-        embeddings_c["tol"] = tol
-        embeddings_c["train_split"] = train_split
-        embeddings_c["eval"] = i
+        reports["train"].append(postprocessor.train_report())
+        reports["class"].append(postprocessor.classes_report())
+        reports["auc"].append(postprocessor.auc_report())
+        reports["roc"].append(postprocessor.roc_report())
+    shards = {
+        name: pd.concat(dfs, ignore_index=True)
+        for name, dfs in reports.items()
+    }
+    # Kept in the ledger with the reports of the task
+    shards["model"] = CLGArtifact(
+        best_model, k, labeling_strategy, FEATURE_SEED
+    )
+
+    # Snapshots taken after a replica stopped are left out
+    epochs = np.where(
+        snapshots.epochs[None, :] <= stopping.epochs[:, None],
+        snapshots.epochs[None, :],
+        -1,
+    )
+    shards["embeddings"] = EmbeddingRuns(
+        pd.DataFrame(
+            {
+                "k": k,
+                "tol": tol,
+                "train_split": train_split,
+                "eval": np.arange(1, N_EVALS + 1),
+            }
+        ),
+        epochs,
+        np.tile(preprocessor.labels, (N_EVALS, 1)),
+        snapshots.snapshots.transpose(1, 0, 2, 3),
+    )
+    return shards
 
-        embeddings_result = Postprocessing.update_report(
-            embeddings_result, embeddings_c
-        )
-        train_result = Postprocessing.update_report(
-            train_result, postprocessor.train_report()
-        )
-        class_result = Postprocessing.update_report(
-            class_result, postprocessor.classes_report()
-        )
-        auc_result = Postprocessing.update_report(
-            auc_result, postprocessor.auc_report()
-        )
-        roc_result = Postprocessing.update_report(
-            roc_result, postprocessor.roc_report()
-        )
 
-if not isdir(RESULT_BASEDIR):
-    makedirs(RESULT_BASEDIR)
-embeddings_result.to_csv(embeddings_result_file(RESULT_BASEDIR, GRAPHNAME))
-train_result.to_csv(train_result_file(RESULT_BASEDIR, GRAPHNAME))
-class_result.to_csv(class_result_file(RESULT_BASEDIR, GRAPHNAME))
-auc_result.to_csv(auc_result_file(RESULT_BASEDIR, GRAPHNAME))
-roc_result.to_csv(roc_result_file(RESULT_BASEDIR, GRAPHNAME))
+if __name__ == "__main__":
+    # Finished tasks are kept in the shard directory, so that an
+    # interrupted sweep resumes where it stopped. Remove it to start over.
+    runner = SweepRunner(
+        run_combination,
+        num_workers=NUM_WORKERS,
+        ledger=TaskLedger(sweep_shard_dir(RESULT_BASEDIR, GRAPHNAME), CONFIG),
+    )
+    tasks = [(k, tol, split, 0) for k, tol, split in combinations]
+
+    # Reports are streamed to Parquet files next to the former csv ones,
+    # and the embedding snapshots to a binary store
+    reports = {
+        "train": train_result_file(RESULT_BASEDIR, GRAPHNAME),
+        "class": class_result_file(RESULT_BASEDIR, GRAPHNAME),
+        "auc": auc_result_file(RESULT_BASEDIR, GRAPHNAME),
+        "roc": roc_result_file(RESULT_BASEDIR, GRAPHNAME),
+    }
+    store_shape = (
+        len(tasks) * N_EVALS,
+        len(SNAPSHOT_EPOCHS),
+        G.number_of_edges(),
+        HIDDEN_CHANNELS,
+    )
+    with ReportWriter(
+        {name: columnar_file(f) for name, f in reports.items()}
+    ) as writer, EmbeddingStore(
+        embeddings_store_dir(RESULT_BASEDIR, GRAPHNAME), store_shape
+    ) as store:
+        for (k, tol, split, _), shards in zip(tasks, runner.run(tasks)):
+            store.append(shards.pop("embeddings"))
+            # Saved from the shards on every run, also when they are
+            # loaded from the ledger, so that the models always match
+            # the reports written next to them
+            artifact_file = model_artifact_file(
+                RESULT_BASEDIR, GRAPHNAME, k, tol, split
+            )
+            makedirs(dirname(artifact_file), exist_ok=True)
+            shards.pop("model").save(artifact_file)
+            writer.write(shards)
@@ -0,0 +1,74 @@
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import torch
+
+from contingency.models.network import Network
+from refactor.approaches.artifact import (CLGArtifact,
+                                          DEFAULT_INFERENCE_BACKEND)
+
+
+class GNNScreener:
+    # Ranks the edges of a network with a CLG trained on the criticality
+    # labels of one contingency order. Unlike the Screener subclasses it
+    # evaluates no contingency, so there are no deltas: the score of an
+    # edge is the probability of its critical class.
+
+    CRITICAL_CLASS = 1
+
+    def __init__(self,
+                 network: Network,
+                 artifact: CLGArtifact,
+                 module: Optional[torch.nn.Module] = None):
+        self.network = network
+        self.__artifact = artifact
+        # The inference module can be shared by the screeners of many
+        # networks, so that it is compiled only once
+        self.__module = (module if module is not None
+                         else artifact.inference_module())
+        self.__scores: Optional[np.ndarray] = None
+
+    @staticmethod
+    def from_checkpoint(network: Network,
+                        filename: str,
+                        backend: str = DEFAULT_INFERENCE_BACKEND
+                        ) -> "GNNScreener":
+        artifact = CLGArtifact.load(filename)
+        return GNNScreener(network,
+                           artifact,
+                           artifact.inference_module(backend))
+
+    @property
+    def order(self) -> int:
+        return self.__artifact.order
+
+    def __eval_scores(self) -> np.ndarray:
+        x, adj_t = self.__artifact.inputs(self.network.graph)
+        with torch.no_grad():
+            out = self.__module(x, adj_t)
+        return out.softmax(dim=1)[:, GNNScreener.CRITICAL_CLASS].numpy()
+
+    @property
+    def scores(self) -> np.ndarray:
+        # In the order of network.graph.edges
+        if self.__scores is None:
+            self.__scores = self.__eval_scores()
+        return self.__scores
+
+    def __check_order(self, order: int):
+        if order != self.order:
+            raise ValueError(f"Model trained for order {self.order}, "
+                             f"not {order}")
+
+    def critical_probabilities(self, order: int) -> Dict[Tuple[str, str],
+                                                         float]:
+        self.__check_order(order)
+        edges = list(self.network.graph.edges)
+        return dict(zip(edges, self.scores.tolist()))
+
+    def critical_edges(self,
+                       order: int,
+                       n: int) -> List[Tuple[str, str]]:
+        self.__check_order(order)
+        edges = list(self.network.graph.edges)
+        top = np.argsort(-self.scores, kind="stable")[:n]
+        return [edges[i] for i in top]
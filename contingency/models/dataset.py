@@ -1,10 +1,16 @@
 import torch
 from torch_geometric.data import InMemoryDataset, Data
+from torch_geometric.data import Dataset as PyGDataset
 import networkx as nx
+import numpy as np
 import pandas as pd
-from typing import Union, List, Tuple, Dict, Callable
+from functools import partial
+from numpy.lib.format import open_memmap
+from typing import Union, List, Tuple, Dict, Callable, Iterator
 
-from contingency.controllers.screener import Screener
+from contingency.controllers.screener import Screener, ExhaustiveScreener
+from contingency.models.network import Network
+from contingency.utils.metrics import SpectralMetrics
 
 
 class Dataset(InMemoryDataset):
@@ -30,32 +36,39 @@ class Dataset(InMemoryDataset):
 
     
     @staticmethod
-    def __node_pair_metrics() -> Dict[str, Callable]:
+    def __node_pair_metrics(spectral: SpectralMetrics
+                            ) -> Dict[str, Callable]:
+        G = spectral.graph
         return {
-            "Degree": nx.degree_centrality,
-            "EigenvectorCentrality": nx.eigenvector_centrality_numpy,
-            "KatzCentrality": nx.katz_centrality_numpy,
-            "ClosenessCentrality": nx.closeness_centrality,
-            "CurrentFlowCloseness": nx.current_flow_closeness_centrality,
-            "BetweennessCentrality": nx.betweenness_centrality,
-            "CommBetweenness": nx.communicability_betweenness_centrality
+            "Degree": partial(nx.degree_centrality, G),
+            "EigenvectorCentrality": spectral.eigenvector_centrality,
+            "KatzCentrality": spectral.katz_centrality,
+            "ClosenessCentrality": partial(nx.closeness_centrality, G),
+            "CurrentFlowCloseness":
+                spectral.current_flow_closeness_centrality,
+            "BetweennessCentrality": partial(nx.betweenness_centrality, G),
+            "CommBetweenness":
+                spectral.communicability_betweenness_centrality
         }
 
     @staticmethod
-    def __edge_metrics() -> Dict[str, Callable]:
+    def __edge_metrics(spectral: SpectralMetrics) -> Dict[str, Callable]:
+        G = spectral.graph
         return {
-            "EdgeBetweenness": nx.edge_betweenness_centrality,
-            "EdgeCFB": nx.edge_current_flow_betweenness_centrality,
-            "EdgeLoadCentrality": nx.edge_load_centrality
+            "EdgeBetweenness": partial(nx.edge_betweenness_centrality, G),
+            "EdgeCFB": spectral.edge_current_flow_betweenness_centrality,
+            "EdgeLoadCentrality": partial(nx.edge_load_centrality, G)
             }
 
-    def __eval_node_pair_metrics(self, G: nx.Graph) -> pd.DataFrame:
-        metrics = Dataset.__node_pair_metrics()
+    @staticmethod
+    def __eval_node_pair_metrics(spectral: SpectralMetrics) -> pd.DataFrame:
+        G = spectral.graph
+        metrics = Dataset.__node_pair_metrics(spectral)
         indices = []
         results = {e: [] for e in G.edges}
         for n, m in metrics.items():
             indices.append(n)
-            metric_value = m(G)
+            metric_value = m()
             for e in G.edges:
                 # Computes the average of the metric value for
                 # both nodes on the edge
@@ -66,13 +79,15 @@ class Dataset(InMemoryDataset):
                                  index=indices)
         return df_result
 
-    def __eval_edge_metrics(self, G: nx.Graph) -> pd.DataFrame:
-        metrics = Dataset.__edge_metrics()
+    @staticmethod
+    def __eval_edge_metrics(spectral: SpectralMetrics) -> pd.DataFrame:
+        G = spectral.graph
+        metrics = Dataset.__edge_metrics(spectral)
         indices = []
         results = {e: [] for e in G.edges}
         for n, m in metrics.items():
             indices.append(n)
-            metric_value = m(G)
+            metric_value = m()
             for e in G.edges:
                 if e not in metric_value:
                     e_m = (e[1], e[0])
@@ -84,15 +99,19 @@ class Dataset(InMemoryDataset):
                                  index=indices)
         return df_result
 
-    def __eval_metrics(self, G: nx.Graph) -> pd.DataFrame:
-        return pd.concat([self.__eval_node_pair_metrics(G),
-                          self.__eval_edge_metrics(G)]).T
+    @staticmethod
+    def eval_metrics(G: nx.Graph) -> pd.DataFrame:
+        # Spectrum and Laplacian pseudoinverse are factored once
+        # per graph and shared by all the metrics that need them
+        spectral = SpectralMetrics(G)
+        return pd.concat([Dataset.__eval_node_pair_metrics(spectral),
+                          Dataset.__eval_edge_metrics(spectral)]).T
 
     def process(self):
         # Lê os grafos do arquivo
         graphs = nx.read_graph6(self.raw_file_names[0])
         # Calcula os dados de interesse
-        graph_data = [self.__eval_metrics(G) for G in graphs]
+        graph_data = [Dataset.eval_metrics(G) for G in graphs]
         
         print(graph_data[0])
         # Convete para objetos "Data"
@@ -111,3 +130,113 @@ class Dataset(InMemoryDataset):
 
         data, slices = self.collate(data_list)
         torch.save((data, slices), self.processed_paths[0])
+
+
+# Graphs are stored as concatenated edge_index, edge_attr and y arrays
+# with an offsets index, read back through memory maps. Each graph
+# keeps its edges in G.edges order, with the edge metrics as edge_attr
+# and the normalized global deltas as y.
+class MemmapDataset(PyGDataset):
+    def __init__(self,
+                 root: str,
+                 num_nodes: int,
+                 order: int = 1,
+                 num_processors: int = 1,
+                 transform=None,
+                 pre_filter=None):
+        self.num_graph_nodes = num_nodes
+        self.order = order
+        self.__num_processors = num_processors
+        self.__arrays: Dict[str, np.ndarray] = {}
+        super().__init__(root, transform, pre_filter=pre_filter)
+
+    @property
+    def raw_file_names(self) -> Union[str, List[str], Tuple]:
+        return [f"{self.num_graph_nodes}nodes2c.g6"]
+
+    @property
+    def processed_file_names(self):
+        return [f"{name}_k{self.order}.npy"
+                for name in ["edge_index", "edge_attr", "y",
+                             "offsets", "num_nodes"]]
+
+    def download(self):
+        pass
+
+    def __read_graphs(self) -> Iterator[nx.Graph]:
+        with open(self.raw_paths[0], "rb") as f:
+            for line in f:
+                line = line.strip()
+                if len(line) > 0:
+                    yield nx.from_graph6_bytes(line)
+
+    def __eval_targets(self, G: nx.Graph) -> np.ndarray:
+        screener = ExhaustiveScreener(Network("", G),
+                                      self.__num_processors)
+        deltas = screener.normalized_global_deltas(self.order)
+        return np.array([deltas[e] for e in G.edges], dtype=np.float32)
+
+    def process(self):
+        # First pass only counts the edges, so that the arrays
+        # can be allocated on disk and filled graph by graph
+        num_edges = []
+        num_nodes = []
+        for G in self.__read_graphs():
+            if self.pre_filter is not None and not self.pre_filter(G):
+                continue
+            num_edges.append(G.number_of_edges())
+            num_nodes.append(G.number_of_nodes())
+        if len(num_edges) == 0:
+            # The width of edge_attr comes from the metrics of a graph
+            raise ValueError(f"No graph of {self.raw_paths[0]} "
+                             "passes the pre_filter")
+        offsets = np.zeros((len(num_edges) + 1,), dtype=np.int64)
+        offsets[1:] = np.cumsum(num_edges)
+        total = int(offsets[-1])
+
+        paths = self.processed_paths
+        edge_index = open_memmap(paths[0], mode="w+", dtype=np.int64,
+                                 shape=(2, total))
+        y = open_memmap(paths[2], mode="w+", dtype=np.float32,
+                        shape=(total,))
+        edge_attr = None
+        i = 0
+        for G in self.__read_graphs():
+            if self.pre_filter is not None and not self.pre_filter(G):
+                continue
+            metrics = Dataset.eval_metrics(G).to_numpy()
+            if edge_attr is None:
+                edge_attr = open_memmap(paths[1], mode="w+",
+                                        dtype=np.float32,
+                                        shape=(total, metrics.shape[1]))
+            begin, end = offsets[i], offsets[i + 1]
+            edge_index[:, begin:end] = np.array(list(G.edges)).T
+            edge_attr[begin:end, :] = metrics
+            y[begin:end] = self.__eval_targets(G)
+            i += 1
+        for array in [edge_index, edge_attr, y]:
+            array.flush()
+        del edge_index, edge_attr, y
+        np.save(paths[3], offsets)
+        np.save(paths[4], np.array(num_nodes, dtype=np.int64))
+
+    def __array(self, index: int) -> np.ndarray:
+        name = self.processed_paths[index]
+        if name not in self.__arrays:
+            # Copy-on-write maps are writable views over the file,
+            # so torch can wrap them without copying or warning
+            self.__arrays[name] = np.load(name, mmap_mode="c")
+        return self.__arrays[name]
+
+    def len(self) -> int:
+        return len(self.__array(4))
+
+    def get(self, idx: int) -> Data:
+        offsets = self.__array(3)
+        begin, end = offsets[idx], offsets[idx + 1]
+        return Data(
+            edge_index=torch.from_numpy(self.__array(0)[:, begin:end]),
+            edge_attr=torch.from_numpy(self.__array(1)[begin:end]),
+            y=torch.from_numpy(self.__array(2)[begin:end]),
+            num_nodes=int(self.__array(4)[idx]),
+        )
@@ -1,6 +1,118 @@
-from typing import Dict
+from typing import Dict, Tuple, Hashable, List
 import networkx as nx
+import numpy as np
 
 
 def centrality(g: nx.Graph) -> Dict[str, float]:
     return nx.current_flow_betweenness_centrality(g)
+
+
+class SpectralMetrics:
+    def __init__(self, graph: nx.Graph):
+        self.__graph = graph
+        self.__nodes: List[Hashable] = list(graph)
+        self.__node_mapping = {n: i for i, n in enumerate(self.__nodes)}
+        self.__adjacency = None
+        self.__adjacency_spectrum = None
+        self.__laplacian_pinv = None
+        self.__exp_adjacency = None
+
+    @property
+    def graph(self) -> nx.Graph:
+        return self.__graph
+
+    @property
+    def adjacency(self) -> np.ndarray:
+        if self.__adjacency is None:
+            A = nx.to_numpy_array(self.__graph, self.__nodes, weight=None)
+            A[np.nonzero(A)] = 1
+            self.__adjacency = A
+        return self.__adjacency
+
+    @property
+    def adjacency_spectrum(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self.__adjacency_spectrum is None:
+            self.__adjacency_spectrum = np.linalg.eigh(self.adjacency)
+        return self.__adjacency_spectrum
+
+    @property
+    def laplacian_pinv(self) -> np.ndarray:
+        if self.__laplacian_pinv is None:
+            if not nx.is_connected(self.__graph):
+                raise nx.NetworkXError("Graph not connected.")
+            A = self.adjacency
+            n = A.shape[0]
+            L = np.diag(A.sum(axis=1)) - A
+            # For connected graphs L + J/n is invertible and
+            # its inverse differs from L+ by J/n
+            J = np.full((n, n), 1.0 / n)
+            self.__laplacian_pinv = np.linalg.inv(L + J) - J
+        return self.__laplacian_pinv
+
+    @property
+    def exp_adjacency(self) -> np.ndarray:
+        if self.__exp_adjacency is None:
+            w, V = self.adjacency_spectrum
+            self.__exp_adjacency = (V * np.exp(w)) @ V.T
+        return self.__exp_adjacency
+
+    def __node_dict(self, values: np.ndarray) -> Dict[Hashable, float]:
+        return dict(zip(self.__nodes, values.tolist()))
+
+    def eigenvector_centrality(self) -> Dict[Hashable, float]:
+        _, V = self.adjacency_spectrum
+        largest = V[:, -1]
+        norm = np.sign(largest.sum()) * np.linalg.norm(largest)
+        return self.__node_dict(largest / norm)
+
+    def katz_centrality(
+        self, alpha: float = 0.1, beta: float = 1.0
+    ) -> Dict[Hashable, float]:
+        w, V = self.adjacency_spectrum
+        b = np.full((V.shape[0],), beta)
+        centrality = V @ ((V.T @ b) / (1.0 - alpha * w))
+        norm = np.sign(centrality.sum()) * np.linalg.norm(centrality)
+        return self.__node_dict(centrality / norm)
+
+    def current_flow_closeness_centrality(self) -> Dict[Hashable, float]:
+        # Sum of the effective resistances from each node
+        C = self.laplacian_pinv
+        n = C.shape[0]
+        diag = np.diag(C)
+        resistances = n * diag + diag.sum() - 2 * C.sum(axis=1)
+        return self.__node_dict(1.0 / resistances)
+
+    def communicability_betweenness_centrality(
+        self,
+    ) -> Dict[Hashable, float]:
+        A = self.adjacency
+        expA = self.exp_adjacency
+        n = A.shape[0]
+        cbc = np.zeros((n,))
+        for i in range(n):
+            keep = np.arange(n) != i
+            w, V = np.linalg.eigh(A[np.ix_(keep, keep)])
+            expA_i = (V * np.exp(w)) @ V.T
+            expA_keep = expA[np.ix_(keep, keep)]
+            B = (expA_keep - expA_i) / expA_keep
+            cbc[i] = B.sum() - np.trace(B)
+        if n > 2:
+            cbc /= (n - 1.0) ** 2 - (n - 1.0)
+        return self.__node_dict(cbc)
+
+    def edge_current_flow_betweenness_centrality(
+        self, normalized: bool = True
+    ) -> Dict[Tuple[Hashable, Hashable], float]:
+        C = self.laplacian_pinv
+        n = C.shape[0]
+        edges = list(self.__graph.edges)
+        src = np.array([self.__node_mapping[u] for u, _ in edges])
+        dst = np.array([self.__node_mapping[v] for _, v in edges])
+        # Potentials induced by an unit current through each edge.
+        # The flow for a (s, t) pair is |row[s] - row[t]|, summed for
+        # all pairs by sorting each row and weighting by rank.
+        rows = np.sort(C[src] - C[dst], axis=1)
+        ranks = 2 * np.arange(n) - n + 1
+        nb = (n - 1.0) * (n - 2.0) if normalized else 2.0
+        betweenness = rows @ ranks / nb
+        return dict(zip(edges, betweenness.tolist()))
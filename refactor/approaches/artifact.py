@@ -0,0 +1,117 @@
+import networkx as nx
+import torch
+from typing import Any, Dict, Tuple
+
+from refactor.approaches.clg import CLG, CLGInference
+from refactor.approaches.labeling import (
+    AbstractLabeling,
+    labeling_from_identifier,
+)
+from refactor.approaches.preprocessing import random_features
+from refactor.utils.graphs import line_graph_edge_index, normalized_adjacency
+
+# Incremented whenever the saved fields change, so that older artifacts
+# are rejected instead of loaded with missing or misread fields
+ARTIFACT_VERSION = 1
+INFERENCE_BACKENDS = ["eager", "compile", "script"]
+# torch.jit.script is deprecated, so TorchScript is only used on request.
+# torch.export is no option, as it cannot export the sparse products for
+# graphs of any size.
+DEFAULT_INFERENCE_BACKEND = "compile"
+
+
+class CLGArtifact:
+    # A trained CLG with what is needed to score a graph with it: the
+    # contingency order and labeling strategy of its training labels,
+    # and the dimension and seed of its random input features
+    def __init__(
+        self,
+        model: CLG,
+        order: int,
+        labeling_strategy: AbstractLabeling,
+        feature_seed: int,
+    ) -> None:
+        self.__model = model
+        self.__order = order
+        self.__labeling_strategy = labeling_strategy
+        self.__feature_seed = feature_seed
+
+    @property
+    def model(self) -> CLG:
+        return self.__model
+
+    @property
+    def order(self) -> int:
+        return self.__order
+
+    @property
+    def labeling_strategy(self) -> AbstractLabeling:
+        return self.__labeling_strategy
+
+    @property
+    def num_features(self) -> int:
+        return self.__model.hyperparameters["num_inputs"]
+
+    @property
+    def feature_seed(self) -> int:
+        return self.__feature_seed
+
+    def save(self, filename: str) -> None:
+        torch.save(
+            {
+                "version": ARTIFACT_VERSION,
+                "hyperparameters": self.__model.hyperparameters,
+                "state_dict": self.__model.state_dict(),
+                "order": self.__order,
+                "labeling": self.__labeling_strategy.identifier,
+                "features": {
+                    "num_features": self.num_features,
+                    "seed": self.__feature_seed,
+                },
+            },
+            filename,
+        )
+
+    @staticmethod
+    def load(filename: str) -> "CLGArtifact":
+        artifact: Dict[str, Any] = torch.load(filename)
+        version = artifact.get("version")
+        if version != ARTIFACT_VERSION:
+            raise ValueError(
+                f"Unsupported CLG artifact version {version}, "
+                + f"expected {ARTIFACT_VERSION}"
+            )
+        model = CLG(**artifact["hyperparameters"])
+        model.load_state_dict(artifact["state_dict"])
+        model.eval()
+        return CLGArtifact(
+            model,
+            artifact["order"],
+            labeling_from_identifier(tuple(artifact["labeling"])),
+            artifact["features"]["seed"],
+        )
+
+    def inputs(self, graph: nx.Graph) -> Tuple[torch.Tensor, torch.Tensor]:
+        # Features and normalized line graph adjacency of a graph, whose
+        # line graph node k is the edge k of graph.edges
+        m = graph.number_of_edges()
+        x = random_features(m, self.num_features, self.__feature_seed)
+        adj_t = normalized_adjacency(line_graph_edge_index(graph), m)
+        return x, adj_t
+
+    def inference_module(
+        self, backend: str = DEFAULT_INFERENCE_BACKEND
+    ) -> torch.nn.Module:
+        # torch.compile builds its kernels on the first call. The
+        # TorchScript module is frozen, so that its weights are constants
+        # of the optimized graph.
+        if backend not in INFERENCE_BACKENDS:
+            raise ValueError(f"Unknown inference backend {backend}")
+        if backend == "eager":
+            return self.__model.eval()
+        module = CLGInference(self.__model).eval()
+        if backend == "compile":
+            return torch.compile(module)
+        return torch.jit.optimize_for_inference(
+            torch.jit.freeze(torch.jit.script(module))
+        )
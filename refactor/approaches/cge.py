@@ -3,12 +3,92 @@ import numpy as np
 import pandas as pd
 from torch_geometric.nn import Node2Vec
 from torch_geometric.data import Data
-from typing import Tuple, Dict, List
+from typing import Tuple, Dict, List, Optional
+from functools import partial
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.linear_model import LogisticRegression, RidgeClassifier
 from sklearn.metrics import log_loss
-from sklearn.svm import SVC
+from sklearn.svm import SVC, LinearSVC
 from sklearn.neighbors import KNeighborsClassifier
 from sklearn.tree import DecisionTreeClassifier
 
+from refactor.approaches.walks import context_windows
+
+
+class RidgeProbabilityClassifier(BaseEstimator, ClassifierMixin):
+    # Closed form ridge classifier, whose decision function is no
+    # probability. Its probabilities are those of a logistic regression
+    # on the decision function of the training edges (Platt scaling),
+    # without the cross validated fits of CalibratedClassifierCV.
+    def __init__(self, alpha: float = 1.0) -> None:
+        self.alpha = alpha
+
+    def fit(
+        self, X: np.ndarray, y: np.ndarray
+    ) -> "RidgeProbabilityClassifier":
+        self.ridge_ = RidgeClassifier(alpha=self.alpha).fit(X, y)
+        self.classes_ = self.ridge_.classes_
+        self.calibration_ = LogisticRegression().fit(self.__scores(X), y)
+        return self
+
+    def __scores(self, X: np.ndarray) -> np.ndarray:
+        return self.ridge_.decision_function(X).reshape(len(X), -1)
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        return self.calibration_.predict_proba(self.__scores(X))
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.ridge_.predict(X)
+
+
+class LinearSVMProbabilityClassifier(BaseEstimator, ClassifierMixin):
+    # Linear SVM with the cross validated sigmoid calibration of
+    # CalibratedClassifierCV, on up to cv folds but no more than the
+    # training edges of the smallest class. With a single one there are
+    # no folds, and the sigmoid is fitted on the decision function of
+    # the training edges, as for RidgeProbabilityClassifier.
+    def __init__(self, cv: int = 3) -> None:
+        self.cv = cv
+
+    def fit(
+        self, X: np.ndarray, y: np.ndarray
+    ) -> "LinearSVMProbabilityClassifier":
+        folds = min(self.cv, int(np.unique(y, return_counts=True)[1].min()))
+        svm = LinearSVC(random_state=0)
+        if folds >= 2:
+            self.svm_ = None
+            self.calibration_ = CalibratedClassifierCV(svm, cv=folds)
+            self.calibration_.fit(X, y)
+        else:
+            self.svm_ = svm.fit(X, y)
+            self.calibration_ = LogisticRegression().fit(self.__scores(X), y)
+        self.classes_ = self.calibration_.classes_
+        return self
+
+    def __scores(self, X: np.ndarray) -> np.ndarray:
+        return self.svm_.decision_function(X).reshape(len(X), -1)
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        if self.svm_ is None:
+            return self.calibration_.predict_proba(X)
+        return self.calibration_.predict_proba(self.__scores(X))
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+# Classifiers of the edge embeddings by name. The SVC fits a 5-fold
+# Platt scaling for its probabilities, the linear SVM a sigmoid
+# calibration of a much cheaper model, the logistic regression gives
+# probabilities from a single fit and the ridge one from two small ones.
+CLASSIFIERS = {
+    "svc": partial(SVC, random_state=0, probability=True),
+    "logreg": partial(LogisticRegression, max_iter=1000),
+    "linear_svm": LinearSVMProbabilityClassifier,
+    "ridge": RidgeProbabilityClassifier,
+}
+
 
 class CGE:
     def __init__(
@@ -21,7 +101,10 @@ class CGE:
         number_of_negative_samples: int,
         p: int,
         q: int,
+        classifier: str = "svc",
     ):
+        if classifier not in CLASSIFIERS:
+            raise ValueError(f"Unknown classifier {classifier}")
         self.data = data
         self.embedding_dimension = embedding_dimension
         self.embedding_model = Node2Vec(
@@ -35,72 +118,97 @@ class CGE:
             q=q,
             sparse=True,
         )
-        self.classification_model = SVC(random_state=0, probability=True)
+        self.classification_model = CLASSIFIERS[classifier]()
+        self.__edge_table: Optional[np.ndarray] = None
+        self.__table_version: Optional[int] = None
+        self.__sorted_edge_keys: Optional[np.ndarray] = None
+        self.__edge_key_order: Optional[np.ndarray] = None
+
+    def __edge_keys(self, edges: np.ndarray) -> np.ndarray:
+        return edges[:, 0].astype(np.int64) * self.data.num_nodes + edges[
+            :, 1
+        ].astype(np.int64)
+
+    def edge_rows(self, edges: np.ndarray) -> np.ndarray:
+        # Rows of the given (k x 2) edges, in either orientation, in the
+        # edge embedding table, i.e. the columns of data.edge_index
+        if self.__sorted_edge_keys is None:
+            keys = self.__edge_keys(self.data.edge_index.t().numpy())
+            self.__edge_key_order = np.argsort(keys, kind="stable")
+            self.__sorted_edge_keys = keys[self.__edge_key_order]
+        keys = self.__edge_keys(np.asarray(edges).reshape(-1, 2))
+        positions = np.searchsorted(self.__sorted_edge_keys, keys)
+        positions = np.minimum(positions, len(self.__sorted_edge_keys) - 1)
+        if not np.array_equal(self.__sorted_edge_keys[positions], keys):
+            raise KeyError("Edges not in data.edge_index")
+        return self.__edge_key_order[positions]
+
+    @property
+    def edge_embeddings_table(self) -> np.ndarray:
+        # (E x d) Hadamard products of the endpoint embeddings of each
+        # column of data.edge_index. It is recomputed only when the
+        # embedding weights changed in place since the last time, i.e.
+        # after an optimizer step or a restored state.
+        weight = self.embedding_model.embedding.weight
+        if self.__table_version != weight._version:
+            z = self.embedding_model().detach().cpu().numpy()
+            src, dst = self.data.edge_index.numpy()
+            self.__edge_table = z[src] * z[dst]
+            self.__table_version = weight._version
+        return self.__edge_table
 
     @property
     def edge_embeddings(self) -> Dict[tuple, np.ndarray]:
-        z = self.embedding_model().detach().cpu().numpy()
-        edge_embedding = {}
-        for u, v in self.data.edge_index.t():
-            edge_embedding[(int(u.numpy()), int(v.numpy()))] = np.multiply(
-                z[u], z[v]
-            )
-        return edge_embedding
+        table = self.edge_embeddings_table
+        edges = map(tuple, self.data.edge_index.t().tolist())
+        return dict(zip(edges, table))
+
+    def edge_embeddings_array(self, edges: np.ndarray) -> np.ndarray:
+        # (k x d) embeddings of the given (k x 2) edges
+        return self.edge_embeddings_table[self.edge_rows(edges)]
 
     def edge_embeddings_with_labels(
         self, edges_by_labels: Dict[int, np.ndarray]
     ) -> pd.DataFrame:
-        embeddings = self.edge_embeddings
         labels = list(edges_by_labels.keys())
-        df = pd.DataFrame()
-        embeddings_by_labels: Dict[int, np.ndarray] = {
-            label: np.zeros(
-                (edges_by_labels[label].shape[0], self.embedding_dimension)
-            )
-            for label in labels
-        }
-        for label in labels:
-            for i, edge in enumerate(edges_by_labels[label]):
-                edge_tuple = (edge[0], edge[1])
-                embeddings_by_labels[label][i, :] = embeddings[edge_tuple]
-
-            df_label = pd.DataFrame(
-                embeddings_by_labels[label],
-                columns=[
-                    f"z{d}" for d in range(1, self.embedding_dimension + 1)
-                ],
-            )
-            df_label["label"] = label
-            df = pd.concat([df, df_label], ignore_index=True)
+        embeddings = self.edge_embeddings_array(
+            np.concatenate([edges_by_labels[label] for label in labels])
+        )
+        df = pd.DataFrame(
+            embeddings,
+            columns=[f"z{d}" for d in range(1, self.embedding_dimension + 1)],
+        )
+        df["label"] = np.repeat(
+            labels, [len(edges_by_labels[label]) for label in labels]
+        )
         return df
 
+    def __labeled_data(
+        self,
+        edges: List[np.ndarray],
+        edges_labels: Dict[Tuple[int, int], int],
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        edges = np.asarray(edges).reshape(-1, 2)
+        X = self.edge_embeddings_array(edges).astype(np.float64)
+        y = np.array(
+            [edges_labels[(u, v)] for u, v in edges.tolist()],
+            dtype=np.float64,
+        )
+        return X, y
+
     def train_data(
         self,
         train_edges: List[np.ndarray],
         edges_labels: Dict[Tuple[int, int], int],
     ) -> Tuple[np.ndarray, np.ndarray]:
-        n_edges_train = len(train_edges)
-        X_train = np.zeros((n_edges_train, self.embedding_dimension))
-        y_train = np.zeros((n_edges_train,))
-        for i in range(n_edges_train):
-            edge = (train_edges[i][0], train_edges[i][1])
-            X_train[i, :] = self.edge_embeddings[edge]
-            y_train[i] = edges_labels[edge]
-        return X_train, y_train
+        return self.__labeled_data(train_edges, edges_labels)
 
     def test_data(
         self,
         test_edges: List[np.ndarray],
         edges_labels: Dict[Tuple[int, int], int],
     ) -> Tuple[np.ndarray, np.ndarray]:
-        n_edges_test = len(test_edges)
-        X_test = np.zeros((n_edges_test, self.embedding_dimension))
-        y_test = np.zeros((n_edges_test,))
-        for i in range(n_edges_test):
-            edge = (test_edges[i][0], test_edges[i][1])
-            X_test[i, :] = self.edge_embeddings[edge]
-            y_test[i] = edges_labels[edge]
-        return X_test, y_test
+        return self.__labeled_data(test_edges, edges_labels)
 
 
 def train_embedding(
@@ -108,13 +216,27 @@ def train_embedding(
     data: Data,
     optimizer: torch.optim.Optimizer,
     train_edges,
-    test_edges,
+    val_edges,
     edges_labels,
+    validate: bool = True,
+    walks: Optional[torch.Tensor] = None,
 ):
+    # The classifier is only fitted to evaluate the validation loss, so
+    # on the epochs not validated the loss is nan. Pre-sampled walks of
+    # the epoch, from a WalkCorpus, replace the ones of the Node2Vec
+    # loader, and only the negative samples are drawn.
     model.embedding_model.train()
-    loader = model.embedding_model.loader(
-        batch_size=data.num_nodes, shuffle=True
-    )
+    if walks is None:
+        loader = model.embedding_model.loader(
+            batch_size=data.num_nodes, shuffle=True
+        )
+    else:
+        loader = [
+            (
+                context_windows(walks, model.embedding_model.context_size),
+                model.embedding_model.neg_sample(torch.arange(data.num_nodes)),
+            )
+        ]
     total_loss = 0
     for pos_rw, neg_rw in loader:
         optimizer.zero_grad()
@@ -122,12 +244,14 @@ def train_embedding(
         loss.backward()
         optimizer.step()
         total_loss += loss.item()
+    if not validate:
+        return total_loss / len(loader), np.nan
 
     train_classification(model, train_edges, edges_labels)
-    X_test, y_test = model.test_data(test_edges, edges_labels)
-    yhat = model.classification_model.predict_proba(X_test)
+    X_val, y_val = model.test_data(val_edges, edges_labels)
+    yhat = model.classification_model.predict_proba(X_val)
 
-    return total_loss / len(loader), log_loss(y_test, yhat)
+    return total_loss / len(loader), log_loss(y_val, yhat)
 
 
 def train_classification(
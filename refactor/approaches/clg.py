@@ -1,3 +1,4 @@
+from contextlib import contextmanager
 import torch
 import torch.nn.functional as F
 from torch.nn import Linear
@@ -5,7 +6,57 @@ from torch_geometric.nn import GCNConv
 from torch_geometric.data import Data
 import numpy as np
 import pandas as pd
-from typing import Tuple, Dict
+from typing import Any, Tuple, Dict, List, Optional
+
+from refactor.approaches.clustering import ClusterBatches
+
+
+def embeddings_with_labels(
+    embeddings: np.ndarray, nodes_by_labels: Dict[int, np.ndarray]
+) -> pd.DataFrame:
+    # Gathers the rows of each label from a (..., n x d) array. Rows are
+    # ordered by the leading axes, then by label.
+    labels = list(nodes_by_labels.keys())
+    nodes = np.concatenate([nodes_by_labels[label] for label in labels])
+    d = embeddings.shape[-1]
+    gathered = embeddings[..., nodes, :].reshape(-1, d)
+    df = pd.DataFrame(gathered, columns=[f"z{i}" for i in range(1, d + 1)])
+    df["label"] = np.tile(
+        np.repeat(labels, [len(nodes_by_labels[label]) for label in labels]),
+        gathered.shape[0] // max(len(nodes), 1),
+    )
+    return df
+
+
+def chunked_propagation(
+    adj_t: torch.Tensor,
+    x: torch.Tensor,
+    weight: torch.Tensor,
+    bias: torch.Tensor,
+    batch_size: int,
+) -> torch.Tensor:
+    # adj_t @ (x @ weight) + bias, as computed by GCNConv, batch_size
+    # rows of the CSR adj_t at a time, so that besides the transformed
+    # features and the output only one batch is held in memory
+    n = adj_t.shape[0]
+    xw = torch.empty((x.shape[0], weight.shape[1]))
+    for begin in range(0, x.shape[0], batch_size):
+        xw[begin : begin + batch_size] = x[begin : begin + batch_size] @ weight
+    crow = adj_t.crow_indices()
+    col = adj_t.col_indices()
+    values = adj_t.values()
+    out = torch.empty((n, weight.shape[1]))
+    for begin in range(0, n, batch_size):
+        end = min(begin + batch_size, n)
+        low, high = int(crow[begin]), int(crow[end])
+        rows = torch.sparse_csr_tensor(
+            crow[begin : end + 1] - low,
+            col[low:high],
+            values[low:high],
+            (end - begin, xw.shape[0]),
+        )
+        out[begin:end] = torch.sparse.mm(rows, xw) + bias
+    return out
 
 
 class CLG(torch.nn.Module):
@@ -17,69 +68,363 @@ class CLG(torch.nn.Module):
         dropout: float,
     ):
         super().__init__()
+        self._num_inputs = num_inputs
+        self._num_outputs = num_outputs
         self._dropout = dropout
         self._hidden_channels = hidden_channels
-        self.conv1 = GCNConv(num_inputs, hidden_channels)
-        self.conv2 = GCNConv(hidden_channels, hidden_channels)
+        # The convolutions take the cached normalized adjacency adj_t
+        self.conv1 = GCNConv(num_inputs, hidden_channels, normalize=False)
+        self.conv2 = GCNConv(hidden_channels, hidden_channels, normalize=False)
+        self.embedding = torch.nn.Identity()
         self.linear = Linear(hidden_channels, num_outputs)
 
-    def forward(self, x, edge_index):
-        x = self.conv1(x, edge_index)
+    @property
+    def hyperparameters(self) -> Dict[str, Any]:
+        return {
+            "num_inputs": self._num_inputs,
+            "hidden_channels": self._hidden_channels,
+            "num_outputs": self._num_outputs,
+            "dropout": self._dropout,
+        }
+
+    def forward(self, x, adj_t):
+        x = self.conv1(x, adj_t)
         x = x.relu()
         x = F.dropout(x, p=self._dropout, training=self.training)
-        x = self.conv2(x, edge_index)
-        self.node_embeddings = x.detach().numpy()
+        x = self.embedding(self.conv2(x, adj_t))
         x = x.relu()
         x = F.dropout(x, p=self._dropout, training=self.training)
         x = self.linear(x)
         return x
 
-    def node_embeddings_with_labels(
-        self, nodes_by_labels: Dict[int, np.ndarray]
-    ) -> pd.DataFrame:
-        embeddings = self.node_embeddings
-        labels = list(nodes_by_labels.keys())
-        df = pd.DataFrame()
-        embeddings_by_labels = {
-            label: np.zeros(
-                (nodes_by_labels[label].shape[0], self._hidden_channels)
+    @torch.no_grad()
+    def inference(
+        self, x: torch.Tensor, adj_t: torch.Tensor, batch_size: int
+    ) -> torch.Tensor:
+        # Layer by layer over the whole graph, in evaluation mode
+        x = chunked_propagation(
+            adj_t, x, self.conv1.lin.weight.t(), self.conv1.bias, batch_size
+        )
+        x = x.relu()
+        x = chunked_propagation(
+            adj_t, x, self.conv2.lin.weight.t(), self.conv2.bias, batch_size
+        )
+        x = self.embedding(x).relu()
+        return self.linear(x)
+
+
+class CLGInference(torch.nn.Module):
+    # Evaluation only CLG, with the convolutions written as the sparse
+    # products GCNConv computes on adj_t and without dropout, so that it
+    # can be scripted or compiled. Returns the same logits as the model.
+    def __init__(self, model: CLG):
+        super().__init__()
+        for name, layer in [
+            ("1", model.conv1.lin),
+            ("2", model.conv2.lin),
+            ("3", model.linear),
+        ]:
+            self.register_buffer(
+                f"weight{name}", layer.weight.detach().t().contiguous()
             )
-            for label in labels
-        }
-        for label in labels:
-            for i, node in enumerate(nodes_by_labels[label]):
-                embeddings_by_labels[label][i, :] = embeddings[node, :]
+        self.register_buffer("bias1", model.conv1.bias.detach().clone())
+        self.register_buffer("bias2", model.conv2.bias.detach().clone())
+        self.register_buffer("bias3", model.linear.bias.detach().clone())
+
+    def forward(self, x: torch.Tensor, adj_t: torch.Tensor) -> torch.Tensor:
+        x = torch.sparse.mm(adj_t, x @ self.weight1) + self.bias1
+        x = x.relu()
+        x = torch.sparse.mm(adj_t, x @ self.weight2) + self.bias2
+        x = x.relu()
+        return x @ self.weight3 + self.bias3
+
+
+class EmbeddingSnapshots:
+    # Copies the output of model.embedding, for the forward passes run
+    # inside capture() at one of the given epochs, into a float32 buffer
+    # of shape (num_snapshots x ...) allocated on the first capture. On
+    # the other epochs no hook is registered at all.
+    def __init__(self, model: torch.nn.Module, epochs: List[int]) -> None:
+        self.__model = model
+        self.__epochs = np.array(sorted(set(epochs)), dtype=np.int64)
+        self.__positions = {e: i for i, e in enumerate(self.__epochs.tolist())}
+        self.__taken = np.zeros((len(self.__epochs),), dtype=bool)
+        self.__buffer: Optional[np.ndarray] = None
+        self.__position = 0
 
-            df_label = pd.DataFrame(
-                embeddings_by_labels[label],
-                columns=[f"z{d}" for d in range(1, self._hidden_channels + 1)],
+    def __hook(
+        self,
+        module: torch.nn.Module,
+        inputs: Tuple[torch.Tensor],
+        output: torch.Tensor,
+    ) -> None:
+        if self.__buffer is None:
+            self.__buffer = np.empty(
+                (len(self.__epochs),) + tuple(output.shape), dtype=np.float32
             )
-            df_label["label"] = label
-            df = pd.concat([df, df_label], ignore_index=True)
+        torch.from_numpy(self.__buffer[self.__position]).copy_(output.detach())
+
+    @contextmanager
+    def capture(self, epoch: int):
+        if epoch not in self.__positions:
+            yield
+            return
+        self.__position = self.__positions[epoch]
+        handle = self.__model.embedding.register_forward_hook(self.__hook)
+        try:
+            yield
+        finally:
+            handle.remove()
+        self.__taken[self.__position] = True
+
+    @property
+    def epochs(self) -> np.ndarray:
+        return self.__epochs[self.__taken]
+
+    @property
+    def snapshots(self) -> np.ndarray:
+        if self.__buffer is None:
+            return np.empty((0,), dtype=np.float32)
+        return self.__buffer[self.__taken]
+
+    def node_embeddings_with_labels(
+        self,
+        nodes_by_labels: Dict[int, np.ndarray],
+        replica: Optional[int] = None,
+    ) -> pd.DataFrame:
+        # For BatchedCLG the snapshots are (num_snapshots x R x n x d)
+        snapshots = self.snapshots
+        if snapshots.shape[0] == 0:
+            return pd.DataFrame()
+        if replica is not None:
+            snapshots = snapshots[:, replica]
+        df = embeddings_with_labels(snapshots, nodes_by_labels)
+        df["epoch"] = np.repeat(self.epochs, len(df) // snapshots.shape[0])
         return df
 
 
 def train(
-    model: CLG,
+    model: torch.nn.Module,
     data: Data,
     optimizer: torch.optim.Optimizer,
     criterion: torch.nn.CrossEntropyLoss,
 ):
     model.train()
     optimizer.zero_grad()  # Clear gradients.
-    out = model(data.x, data.edge_index)  # Perform a single forward pass.
+    out = model(data.x, data.adj_t)  # Perform a single forward pass.
     loss = criterion(
         out[data.train_mask], data.y[data.train_mask]
     )  # Compute the loss solely based on the training nodes.
     loss.backward()  # Derive gradients.
     optimizer.step()  # Update parameters based on gradients.
 
-    val_loss = criterion(out[data.test_mask], data.y[data.test_mask])
+    # The validation loss is that of the updated weights, the ones early
+    # stopping keeps, without dropout
+    model.eval()
+    with torch.no_grad():
+        out = model(data.x, data.adj_t)
+        val_loss = criterion(out[data.val_mask], data.y[data.val_mask])
 
     return loss.item(), val_loss.item()
 
 
-def test(model: CLG, data: Data) -> Tuple[torch.Tensor, torch.Tensor]:
+def test(
+    model: torch.nn.Module, data: Data
+) -> Tuple[torch.Tensor, torch.Tensor]:
     model.eval()
-    out = model(data.x, data.edge_index)
+    out = model(data.x, data.adj_t)
     return data.y[data.test_mask], out[data.test_mask]
+
+
+class BatchedCLG(torch.nn.Module):
+    # Stacks the parameters of independent CLG replicas, so that all of
+    # them are trained in a single forward / backward pass. Features of
+    # every replica are propagated together as one (n x R * h) block.
+    def __init__(self, replicas: List[CLG]):
+        super().__init__()
+        reference = replicas[0]
+        self._dropout = reference._dropout
+        self._hidden_channels = reference._hidden_channels
+        self._num_replicas = len(replicas)
+        self.weight1 = torch.nn.Parameter(
+            torch.stack([r.conv1.lin.weight.detach().t() for r in replicas])
+        )
+        self.bias1 = torch.nn.Parameter(
+            torch.stack([r.conv1.bias.detach() for r in replicas])
+        )
+        self.weight2 = torch.nn.Parameter(
+            torch.stack([r.conv2.lin.weight.detach().t() for r in replicas])
+        )
+        self.bias2 = torch.nn.Parameter(
+            torch.stack([r.conv2.bias.detach() for r in replicas])
+        )
+        self.weight3 = torch.nn.Parameter(
+            torch.stack([r.linear.weight.detach().t() for r in replicas])
+        )
+        self.bias3 = torch.nn.Parameter(
+            torch.stack([r.linear.bias.detach() for r in replicas])
+        )
+        self.embedding = torch.nn.Identity()
+
+    @property
+    def num_replicas(self) -> int:
+        return self._num_replicas
+
+    def replica(self, r: int) -> CLG:
+        model = CLG(
+            num_inputs=self.weight1.shape[1],
+            hidden_channels=self._hidden_channels,
+            num_outputs=self.weight3.shape[2],
+            dropout=self._dropout,
+        )
+        with torch.no_grad():
+            model.conv1.lin.weight.copy_(self.weight1[r].t())
+            model.conv1.bias.copy_(self.bias1[r])
+            model.conv2.lin.weight.copy_(self.weight2[r].t())
+            model.conv2.bias.copy_(self.bias2[r])
+            model.linear.weight.copy_(self.weight3[r].t())
+            model.linear.bias.copy_(self.bias3[r])
+        return model
+
+    def __conv(
+        self,
+        x: torch.Tensor,
+        adj_t: torch.Tensor,
+        weight: torch.Tensor,
+        bias: torch.Tensor,
+    ) -> torch.Tensor:
+        # (R x n x i) @ (R x i x o) -> propagated as (n x R * o)
+        r, n, _ = x.shape
+        x = torch.bmm(x, weight).transpose(0, 1).reshape(n, -1)
+        x = torch.sparse.mm(adj_t, x)
+        return x.reshape(n, r, -1).transpose(0, 1) + bias.unsqueeze(1)
+
+    def forward(self, x, adj_t):
+        x = x.unsqueeze(0).expand(self._num_replicas, -1, -1)
+        x = self.__conv(x, adj_t, self.weight1, self.bias1)
+        x = x.relu()
+        x = F.dropout(x, p=self._dropout, training=self.training)
+        x = self.embedding(self.__conv(x, adj_t, self.weight2, self.bias2))
+        x = x.relu()
+        x = F.dropout(x, p=self._dropout, training=self.training)
+        x = torch.baddbmm(self.bias3.unsqueeze(1), x, self.weight3)
+        return x
+
+    @torch.no_grad()
+    def inference(
+        self, x: torch.Tensor, adj_t: torch.Tensor, batch_size: int
+    ) -> torch.Tensor:
+        # Layer by layer over the whole graph, in evaluation mode, one
+        # replica at a time
+        replicas = range(self._num_replicas)
+        x = torch.stack(
+            [
+                chunked_propagation(
+                    adj_t, x, self.weight1[r], self.bias1[r], batch_size
+                )
+                for r in replicas
+            ]
+        ).relu()
+        x = torch.stack(
+            [
+                chunked_propagation(
+                    adj_t, x[r], self.weight2[r], self.bias2[r], batch_size
+                )
+                for r in replicas
+            ]
+        )
+        x = self.embedding(x).relu()
+        return torch.baddbmm(self.bias3.unsqueeze(1), x, self.weight3)
+
+
+def replica_losses(
+    out: torch.Tensor, y: torch.Tensor, masks: torch.Tensor
+) -> torch.Tensor:
+    # Mean loss of each replica r, from its (n x c) logits out[r], over
+    # the elements of masks[r]
+    losses = F.cross_entropy(
+        out.transpose(1, 2),
+        y.clamp(min=0).unsqueeze(0).expand(out.shape[0], -1),
+        reduction="none",
+    )
+    return (losses * masks).sum(dim=1) / masks.sum(dim=1)
+
+
+def train_batched(
+    model: BatchedCLG,
+    data: Data,
+    optimizer: torch.optim.Optimizer,
+    train_masks: torch.Tensor,
+    val_masks: torch.Tensor,
+) -> Tuple[np.ndarray, np.ndarray]:
+    # Each replica r is trained on its own mask row. The replicas do
+    # not share parameters, so the gradient of the summed losses is the
+    # gradient of each replica loss. The validation losses are those of
+    # the updated weights, without dropout, as in train.
+    model.train()
+    optimizer.zero_grad()
+    out = model(data.x, data.adj_t)
+    train_losses = replica_losses(out, data.y, train_masks)
+    train_losses.sum().backward()
+    optimizer.step()
+    model.eval()
+    with torch.no_grad():
+        out = model(data.x, data.adj_t)
+        val_losses = replica_losses(out, data.y, val_masks)
+    return train_losses.detach().numpy(), val_losses.numpy()
+
+
+def train_batched_clusters(
+    model: BatchedCLG,
+    batches: ClusterBatches,
+    optimizer: torch.optim.Optimizer,
+    train_masks: torch.Tensor,
+    val_masks: torch.Tensor,
+    inference_batch_size: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    # One step for each cluster batch, as train_batched on the batch
+    # subgraph. The train losses of the epoch are averaged over the
+    # masked nodes of every batch, and the validation losses are those
+    # of the weights at the end of the epoch, run layer by layer over
+    # the whole graph.
+    model.train()
+    sums = torch.zeros((model.num_replicas,))
+    counts = torch.zeros((model.num_replicas,))
+    for nodes, batch in batches:
+        optimizer.zero_grad()
+        out = model(batch.x, batch.adj_t)
+        y = batch.y.unsqueeze(0).expand(model.num_replicas, -1)
+        losses = F.cross_entropy(
+            out.transpose(1, 2), y.clamp(min=0), reduction="none"
+        )
+        masks = train_masks[:, nodes]
+        batch_sums = (losses * masks).sum(dim=1)
+        batch_counts = masks.sum(dim=1)
+        # A batch may have no train node of some replica
+        (batch_sums / batch_counts.clamp(min=1)).sum().backward()
+        optimizer.step()
+        sums += batch_sums.detach()
+        counts += batch_counts
+    model.eval()
+    data = batches.data
+    out = model.inference(data.x, data.adj_t, inference_batch_size)
+    val_losses = replica_losses(out, data.y, val_masks)
+    return (sums / counts.clamp(min=1)).numpy(), val_losses.numpy()
+
+
+def test_batched(
+    model: BatchedCLG,
+    data: Data,
+    test_masks: torch.Tensor,
+    batch_size: Optional[int] = None,
+) -> List[Tuple[torch.Tensor, torch.Tensor]]:
+    # With a batch_size, the whole graph is run layer by layer
+    model.eval()
+    if batch_size is None:
+        out = model(data.x, data.adj_t)
+    else:
+        out = model.inference(data.x, data.adj_t, batch_size)
+    return [
+        (data.y[test_masks[r]], out[r][test_masks[r]])
+        for r in range(model.num_replicas)
+    ]
@@ -0,0 +1,102 @@
+import numpy as np
+import torch
+from torch_geometric.data import Data
+from torch_geometric.utils import subgraph
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from refactor.utils.graphs import (
+    greedy_partition,
+    normalized_adjacency,
+    spectral_partition,
+)
+
+PARTITIONERS: Dict[str, Callable[..., np.ndarray]] = {
+    "greedy": greedy_partition,
+    "spectral": spectral_partition,
+}
+
+
+class ClusterBatches:
+    # Cluster-GCN batches of a graph: its nodes are split once into
+    # num_parts clusters, and on each pass the clusters are shuffled and
+    # grouped clusters_per_batch at a time. A batch is the subgraph
+    # induced by the union of its clusters, with its own normalized
+    # adjacency, so the edges between clusters of different batches
+    # are left out of that pass.
+    def __init__(
+        self,
+        data: Data,
+        num_parts: int,
+        clusters_per_batch: int = 1,
+        method: str = "greedy",
+        seed: int = 0,
+    ) -> None:
+        if method not in PARTITIONERS:
+            raise ValueError(f"Unknown partition method {method}")
+        self.__data = data
+        self.__num_parts = num_parts
+        self.__clusters_per_batch = clusters_per_batch
+        self.__method = method
+        self.__seed = seed
+        self.__rng = np.random.default_rng(seed)
+        self.__parts: Optional[np.ndarray] = None
+        self.__clusters: Optional[List[np.ndarray]] = None
+
+    @property
+    def data(self) -> Data:
+        return self.__data
+
+    @property
+    def parts(self) -> np.ndarray:
+        # Cluster of each node
+        if self.__parts is None:
+            self.__parts = PARTITIONERS[self.__method](
+                self.__data.edge_index,
+                self.__data.num_nodes,
+                self.__num_parts,
+                self.__seed,
+            )
+        return self.__parts
+
+    @property
+    def clusters(self) -> List[np.ndarray]:
+        if self.__clusters is None:
+            order = np.argsort(self.parts, kind="stable")
+            bounds = np.cumsum(np.bincount(self.parts))[:-1]
+            self.__clusters = [
+                c for c in np.split(order, bounds) if len(c) > 0
+            ]
+        return self.__clusters
+
+    def __len__(self) -> int:
+        return -(-len(self.clusters) // self.__clusters_per_batch)
+
+    def batch(self, nodes: torch.Tensor) -> Data:
+        edge_index, _ = subgraph(
+            nodes,
+            self.__data.edge_index,
+            relabel_nodes=True,
+            num_nodes=self.__data.num_nodes,
+        )
+        batch = Data(
+            x=self.__data.x[nodes],
+            edge_index=edge_index,
+            adj_t=normalized_adjacency(edge_index, len(nodes)),
+            y=self.__data.y[nodes],
+        )
+        for mask in ["train_mask", "val_mask", "test_mask"]:
+            if mask in self.__data:
+                batch[mask] = self.__data[mask][nodes]
+        return batch
+
+    def __iter__(self) -> Iterator[Tuple[torch.Tensor, Data]]:
+        # Nodes of each batch, in the numbering of the graph, with the
+        # batch itself
+        clusters = self.clusters
+        order = self.__rng.permutation(len(clusters))
+        for begin in range(0, len(order), self.__clusters_per_batch):
+            chosen = order[begin : begin + self.__clusters_per_batch]
+            nodes = torch.from_numpy(
+                np.sort(np.concatenate([clusters[c] for c in chosen]))
+            )
+            yield nodes, self.batch(nodes)
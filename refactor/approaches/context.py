@@ -0,0 +1,142 @@
+import networkx as nx
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+import torch
+from torch_geometric.utils import to_undirected
+
+from refactor.approaches.labeling import AbstractLabeling
+from refactor.utils.files import read_criticality
+from refactor.utils.graphs import (
+    align_edge_values,
+    canonical_edges,
+    line_graph_edge_index,
+    normalized_adjacency,
+)
+
+
+class GraphContext:
+    # Graph level artifacts shared by every Preprocessing of the same
+    # graph, so that a parameter sweep builds them only once. The
+    # criticalities are cached by file, i.e. once for each k, and the
+    # labels of all the given labeling strategies of the same kind are
+    # evaluated together the first time one of them is requested. The
+    # GCN normalized adjacencies are shared read-only by every model.
+    # The parsed criticality files are cached in cache_dir, if given.
+    def __init__(
+        self,
+        graph: nx.Graph,
+        labeling_strategies: Optional[List[AbstractLabeling]] = None,
+        cache_dir: Optional[str] = None,
+    ) -> None:
+        self.__graph = graph
+        self.__cache_dir = cache_dir
+        self.__labeling_strategies = (
+            labeling_strategies if labeling_strategies is not None else []
+        )
+        self.__edges = None
+        self.__edge_index = None
+        self.__line_graph_edge_index = None
+        self.__adjacency = None
+        self.__line_graph_adjacency = None
+        self.__degrees = None
+        self.__edge_features = None
+        self.__criticalities: Dict[str, np.ndarray] = {}
+        self.__labels: Dict[Tuple[str, Tuple[str, float]], np.ndarray] = {}
+
+    @property
+    def graph(self) -> nx.Graph:
+        return self.__graph
+
+    @property
+    def edges(self) -> np.ndarray:
+        if self.__edges is None:
+            self.__edges = canonical_edges(self.__graph)
+        return self.__edges
+
+    @property
+    def edge_index(self) -> torch.Tensor:
+        if self.__edge_index is None:
+            edge_index = torch.from_numpy(self.edges.T.astype(np.int64))
+            self.__edge_index = to_undirected(
+                edge_index, num_nodes=self.__graph.number_of_nodes()
+            )
+        return self.__edge_index
+
+    @property
+    def line_graph_edge_index(self) -> torch.Tensor:
+        if self.__line_graph_edge_index is None:
+            self.__line_graph_edge_index = line_graph_edge_index(self.__graph)
+        return self.__line_graph_edge_index
+
+    @property
+    def adjacency(self) -> torch.Tensor:
+        if self.__adjacency is None:
+            self.__adjacency = normalized_adjacency(
+                self.edge_index, self.__graph.number_of_nodes()
+            )
+        return self.__adjacency
+
+    @property
+    def line_graph_adjacency(self) -> torch.Tensor:
+        if self.__line_graph_adjacency is None:
+            self.__line_graph_adjacency = normalized_adjacency(
+                self.line_graph_edge_index, self.__graph.number_of_edges()
+            )
+        return self.__line_graph_adjacency
+
+    @property
+    def degrees(self) -> np.ndarray:
+        if self.__degrees is None:
+            self.__degrees = np.bincount(
+                self.edges.flatten(),
+                minlength=self.__graph.number_of_nodes(),
+            ).astype(np.int32)
+        return self.__degrees
+
+    @property
+    def line_graph_degrees(self) -> np.ndarray:
+        return self.degrees[self.edges].sum(axis=1) - 2
+
+    @property
+    def edge_features(self) -> np.ndarray:
+        # (m x 2) log degrees of the endpoints of each edge, lower one
+        # first, so that they do not depend on its orientation
+        if self.__edge_features is None:
+            self.__edge_features = np.log1p(
+                np.sort(self.degrees[self.edges], axis=1)
+            ).astype(np.float32)
+        return self.__edge_features
+
+    def criticality(self, criticality_edge_file: str) -> np.ndarray:
+        if criticality_edge_file not in self.__criticalities:
+            src, dst, delta = read_criticality(
+                criticality_edge_file, self.__cache_dir
+            )
+            self.__criticalities[criticality_edge_file] = align_edge_values(
+                self.__graph, src, dst, delta
+            )
+        return self.__criticalities[criticality_edge_file]
+
+    def labels(
+        self,
+        criticality_edge_file: str,
+        labeling_strategy: AbstractLabeling,
+    ) -> np.ndarray:
+        key = (criticality_edge_file, labeling_strategy.identifier)
+        if key not in self.__labels:
+            strategy_type = type(labeling_strategy)
+            identifiers = [
+                s.identifier
+                for s in self.__labeling_strategies
+                if type(s) is strategy_type
+            ]
+            identifiers = list(
+                dict.fromkeys(identifiers + [labeling_strategy.identifier])
+            )
+            labels = strategy_type.label_many(
+                self.criticality(criticality_edge_file),
+                [value for _, value in identifiers],
+            )
+            for identifier, row in zip(identifiers, labels):
+                self.__labels[(criticality_edge_file, identifier)] = row
+        return self.__labels[key]
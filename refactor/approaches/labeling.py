@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Tuple, Any
+from typing import Tuple, List
 import numpy as np
 
 
@@ -7,10 +7,28 @@ class AbstractLabeling(ABC):
     def __init__(self) -> None:
         pass
 
+    def label(self, criticalities: np.ndarray) -> np.ndarray:
+        _, value = self.identifier
+        return self.label_many(criticalities, [value])[0]
+
+    @staticmethod
     @abstractmethod
-    def label(self, criticalities: Dict[tuple, Any]) -> Dict[tuple, int]:
+    def label_many(
+        criticalities: np.ndarray, parameters: List[float]
+    ) -> np.ndarray:
         pass
 
+    @staticmethod
+    def _classes(
+        criticalities: np.ndarray, critical: np.ndarray
+    ) -> np.ndarray:
+        # Rows of critical flag the critical edges for each parameter,
+        # the remaining ones are regular (0) if nonzero or -1 otherwise
+        classes = np.where(criticalities > 0, 0, -1).astype(np.int8)
+        classes = np.tile(classes, (critical.shape[0], 1))
+        classes[critical] = 1
+        return classes
+
     @property
     @abstractmethod
     def identifier(self) -> Tuple[str, float]:
@@ -22,21 +40,20 @@ class ThresholdLabeling(AbstractLabeling):
         self.__threshold = threshold
         super().__init__()
 
-    def label(self, criticalities: Dict[tuple, Any]) -> Dict[tuple, int]:
-        classes = {k: 0 for k in criticalities.keys()}
-        nonzeros = [d for d in list(criticalities.values()) if d > 0]
-        max_criticality = max(nonzeros)
-        min_criticality = min(nonzeros)
-        for d in criticalities.keys():
-            if (criticalities[d] - min_criticality) / (
-                max_criticality - min_criticality
-            ) >= self.__threshold:
-                classes[d] = 1
-            elif criticalities[d] > 0:
-                classes[d] = 0
-            else:
-                classes[d] = -1
-        return classes
+    @staticmethod
+    def label_many(
+        criticalities: np.ndarray, parameters: List[float]
+    ) -> np.ndarray:
+        nonzeros = criticalities[criticalities > 0]
+        max_criticality = nonzeros.max()
+        min_criticality = nonzeros.min()
+        normalized = (criticalities - min_criticality) / (
+            max_criticality - min_criticality
+        )
+        thresholds = np.asarray(parameters)[:, np.newaxis]
+        return AbstractLabeling._classes(
+            criticalities, normalized >= thresholds
+        )
 
     @property
     def identifier(self) -> Tuple[str, float]:
@@ -48,19 +65,28 @@ class QuantileLabeling(AbstractLabeling):
         self.__quantile = quantile
         super().__init__()
 
-    def label(self, criticalities: Dict[tuple, Any]) -> Dict[tuple, int]:
-        classes = {k: 0 for k in criticalities.keys()}
-        nonzeros = np.array([d for d in list(criticalities.values()) if d > 0])
-        threshold = np.quantile(nonzeros, 1 - self.__quantile)
-        for d in criticalities.keys():
-            if criticalities[d] >= threshold:
-                classes[d] = 1
-            elif criticalities[d] > 0:
-                classes[d] = 0
-            else:
-                classes[d] = -1
-        return classes
+    @staticmethod
+    def label_many(
+        criticalities: np.ndarray, parameters: List[float]
+    ) -> np.ndarray:
+        # All the quantiles are taken from a single partition of the
+        # nonzero criticalities
+        nonzeros = criticalities[criticalities > 0]
+        thresholds = np.quantile(nonzeros, 1 - np.asarray(parameters))
+        return AbstractLabeling._classes(
+            criticalities, criticalities >= thresholds[:, np.newaxis]
+        )
 
     @property
     def identifier(self) -> Tuple[str, float]:
         return "quantile", self.__quantile
+
+
+def labeling_from_identifier(
+    identifier: Tuple[str, float],
+) -> AbstractLabeling:
+    name, value = identifier
+    strategies = {"threshold": ThresholdLabeling, "quantile": QuantileLabeling}
+    if name not in strategies:
+        raise ValueError(f"Unknown labeling strategy {name}")
+    return strategies[name](value)
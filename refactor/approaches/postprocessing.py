@@ -2,7 +2,7 @@ import numpy as np
 import torch.nn.functional as F
 import torch
 import pandas as pd
-from typing import Tuple, Dict
+from typing import Tuple, Dict, Optional
 from sklearn.metrics import classification_report
 from sklearn.metrics import roc_curve, roc_auc_score
 
@@ -21,6 +21,7 @@ class Postprocessing:
         train_split: float,
         labeling_strategy: AbstractLabeling,
         eval: int = 0,
+        best_epoch: Optional[int] = None,
     ):
         self.__y = y
         self.__yhat = yhat
@@ -30,6 +31,7 @@ class Postprocessing:
         self.__train_split = train_split
         self.__labeling_strategy = labeling_strategy
         self.__eval = eval
+        self.__best_epoch = best_epoch
 
     @property
     def yhat_classes(self) -> np.ndarray:
@@ -62,6 +64,14 @@ class Postprocessing:
         train_r["k"] = self.__k
         train_r["train_split"] = self.__train_split
         train_r["eval"] = self.__eval
+        # Runs stopped early have fewer epochs and are evaluated with
+        # the parameters of their best epoch
+        train_r["num_epochs"] = len(self.__train_losses)
+        train_r["best_epoch"] = (
+            self.__best_epoch
+            if self.__best_epoch is not None
+            else len(self.__train_losses)
+        )
         name, value = self.__labeling_strategy.identifier
         train_r[name] = value
         return train_r
@@ -109,12 +119,3 @@ class Postprocessing:
         name, value = self.__labeling_strategy.identifier
         df[name] = value
         return df
-
-    @staticmethod
-    def update_report(
-        current: pd.DataFrame, new: pd.DataFrame
-    ) -> pd.DataFrame:
-        if current.empty:
-            return new
-        else:
-            return pd.concat([current, new], ignore_index=True)
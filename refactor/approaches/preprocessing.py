@@ -1,13 +1,81 @@
 import networkx as nx
 import numpy as np
-from typing import Dict, Tuple, List
+from typing import Dict, Tuple, Optional
 import torch
 from torch_geometric.data import Data
-from torch_geometric.utils.convert import from_networkx
 
+from refactor.approaches.context import GraphContext
 from refactor.approaches.labeling import AbstractLabeling, ThresholdLabeling
 
 
+def stratified_split_masks(
+    labels: np.ndarray,
+    train_split: float,
+    num_evals: int,
+    seed: int = 0,
+    val_fraction: float = 0.0,
+) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    # Class balanced train / validation / test masks for num_evals
+    # repetitions, as (num_evals x n) boolean tensors. The validation
+    # elements are taken out of the training ones, val_fraction of them
+    # with at least one of each class, so that early stopping never
+    # looks at the test elements. Each row has its own seed, so it does
+    # not depend on the number of evals. Elements labeled -1 are left
+    # out of every mask.
+    n = labels.shape[0]
+    classes, class_indices, class_counts = np.unique(
+        labels, return_inverse=True, return_counts=True
+    )
+    valid = classes != -1
+    less_elements = class_counts[valid].min()
+    num_train_elements_by_class = max([1, round(train_split * less_elements)])
+    num_val_elements_by_class = 0
+    if val_fraction > 0:
+        num_train_elements_by_class = max([2, num_train_elements_by_class])
+        num_val_elements_by_class = min(
+            max([1, round(val_fraction * num_train_elements_by_class)]),
+            num_train_elements_by_class - 1,
+        )
+    keys = np.stack(
+        [np.random.default_rng([seed, e]).random(n) for e in range(num_evals)]
+    )
+    # Sorting by class and then by the random keys gives, for each
+    # element, its rank in a random permutation of its own class
+    order = np.argsort(class_indices + keys, axis=1)
+    class_starts = np.concatenate([[0], np.cumsum(class_counts)[:-1]])
+    ranks = np.empty_like(order)
+    np.put_along_axis(
+        ranks,
+        order,
+        np.arange(n) - class_starts[class_indices[order]],
+        axis=1,
+    )
+    valid_elements = valid[class_indices]
+    val_masks = (ranks < num_val_elements_by_class) & valid_elements
+    train_masks = (
+        (ranks >= num_val_elements_by_class)
+        & (ranks < num_train_elements_by_class)
+        & valid_elements
+    )
+    test_masks = (ranks >= num_train_elements_by_class) & valid_elements
+    return (
+        torch.from_numpy(train_masks),
+        torch.from_numpy(val_masks),
+        torch.from_numpy(test_masks),
+    )
+
+
+def random_features(
+    num_nodes: int, num_features: int, seed: int
+) -> torch.Tensor:
+    # Uniform input features, reproducible from the seed so that a saved
+    # model is fed the same features at inference
+    rng = np.random.default_rng(seed)
+    return torch.from_numpy(
+        rng.random((num_nodes, num_features), dtype=np.float32)
+    )
+
+
 class Preprocessing:
     def __init__(
         self,
@@ -16,186 +84,108 @@ class Preprocessing:
         train_split: float = 0.10,
         embedding_dimension: int = 32,
         labeling_strategy: AbstractLabeling = ThresholdLabeling(0.7),
+        context: Optional[GraphContext] = None,
+        feature_seed: Optional[int] = None,
     ) -> None:
         self.__graph = graph
-        self.__line_graph = nx.line_graph(graph)
+        self.__context = (
+            context if context is not None else GraphContext(graph)
+        )
         self.__criticality_edge_file = criticality_edge_file
         self.__train_split = train_split
         self.__embedding_dimension = embedding_dimension
         self.__labeling_strategy = labeling_strategy
-        self.__criticality = None
-        self.__nodes_labels = None
+        self.__feature_seed = feature_seed
+        self.__labels = None
         self.__edges_labels = None
         self.__nodes_by_label = None
         self.__edges_by_label = None
-        self.__train_test_nodes = None
-        self.__train_test_edges = None
+        self.__masks: Optional[
+            Tuple[torch.Tensor, torch.Tensor, torch.Tensor]
+        ] = None
         self.__torch_node_data = None
         self.__torch_edge_data = None
 
-    def __read_criticality(self) -> Dict[tuple, float]:
-        criticality = open(self.__criticality_edge_file, "r")
-        lin_criticality = ""
-        criticality_dict: Dict[tuple, float] = {}
-        while True:
-            lin_criticality = criticality.readline()
-            if len(lin_criticality) == 0:
-                break
-            src, dst, delta = lin_criticality.split(",")
-            criticality_dict[(src, dst)] = float(delta)
-        return criticality_dict
-
-    def __generate_labels(self) -> Dict[tuple, int]:
-        return self.__labeling_strategy.label(self.criticality)
-
-    def __canonical_relabeling_nodes(
-        self, classes: Dict[tuple, int]
-    ) -> Dict[tuple, int]:
-        Gn: nx.Graph = nx.convert_node_labels_to_integers(self.line_graph)
-        maps = {
-            novo: antigo
-            for antigo, novo in zip(self.line_graph.nodes, Gn.nodes)
-        }
-        maps = {
-            k: tuple([str(n) for n in sorted([int(n) for n in v])])
-            for k, v in maps.items()
-        }
-        canonical_classes = {}
-        for k, v in maps.items():
-            if v in classes.keys():
-                canonical_classes[k] = classes[v]
-            else:
-                canonical_classes[k] = classes[(v[1], v[0])]
-        return canonical_classes
-
-    def __canonical_relabeling_edges(
-        self, classes: Dict[tuple, int]
-    ) -> Dict[tuple, int]:
-        Gn: nx.Graph = nx.convert_node_labels_to_integers(self.__graph)
-        mapas = {
-            antigo: novo for antigo, novo in zip(self.graph.nodes, Gn.nodes)
-        }
-        canonical_classes = {}
-        for k, v in classes.items():
-            edge = (mapas[k[0]], mapas[k[1]])
-            if (k[0], k[1]) in classes.keys():
-                canonical_classes[edge] = v
-            else:
-                reverse_edge = (mapas[k[1]], mapas[k[0]])
-                canonical_classes[reverse_edge] = v
-        return canonical_classes
-
-    def __divide_nodes_in_classes(
-        self, classes: Dict[tuple, int]
-    ) -> Dict[int, np.ndarray]:
-        class_set = set(classes.values())
-        nodes_classes = {v: [] for v in class_set}
-        for n, c in classes.items():
-            nodes_classes[c].append(n)
-        for c in class_set:
-            nodes_classes[c] = np.array(nodes_classes[c])
-            np.random.shuffle(nodes_classes[c])
-        return nodes_classes
-
-    def __divide_edges_in_classes(
-        self, classes: Dict[tuple, int]
-    ) -> Dict[int, np.ndarray]:
-        class_set = set(classes.values())
-        edges_classes = {v: [] for v in class_set}
-        for n, c in classes.items():
-            edges_classes[c].append(n)
-        for c in class_set:
-            edges_classes[c] = np.array(edges_classes[c])
-            np.random.shuffle(edges_classes[c])
-        return edges_classes
-
-    def __split_nodes(
-        self, nodes_classes: Dict[int, np.ndarray]
-    ) -> Tuple[List[int], List[int]]:
-        class_set = [c for c in list(nodes_classes.keys()) if c != -1]
-        train_nodes_by_classes = {v: [] for v in class_set}
-        test_nodes_by_classes = {v: [] for v in class_set}
-        less_elements = min([len(nodes_classes[v]) for v in class_set])
-        num_train_elements_by_class = max(
-            [1, round(self.__train_split * less_elements)]
+    def __generate_labels(self) -> np.ndarray:
+        return self.__context.labels(
+            self.__criticality_edge_file, self.__labeling_strategy
         )
-        for c in class_set:
-            nodes = nodes_classes[c]
-            train_nodes_by_classes[c] = nodes[:num_train_elements_by_class]
-            test_nodes_by_classes[c] = nodes[num_train_elements_by_class:]
-        train_nodes = []
-        test_nodes = []
-        for c in class_set:
-            train_nodes += list(train_nodes_by_classes[c])
-            test_nodes += list(test_nodes_by_classes[c])
-        return train_nodes, test_nodes
 
-    def __split_edges(self, edges_classes: Dict[int, np.ndarray]):
-        class_set = [c for c in list(edges_classes.keys()) if c != -1]
-        train_edges_by_classes = {v: [] for v in class_set}
-        test_edges_by_classes = {v: [] for v in class_set}
-        less_elements = min([len(edges_classes[v]) for v in class_set])
-        num_train_elements_by_class = max(
-            [1, round(self.__train_split * less_elements)]
-        )
-        for c in class_set:
-            edges = edges_classes[c]
-            train_edges_by_classes[c] = edges[:num_train_elements_by_class]
-            test_edges_by_classes[c] = edges[num_train_elements_by_class:]
-        train_edges = []
-        test_edges = []
-        for c in class_set:
-            train_edges += list(train_edges_by_classes[c])
-            test_edges += list(test_edges_by_classes[c])
-        return train_edges, test_edges
+    def __divide_in_classes(self) -> Dict[int, np.ndarray]:
+        indices_classes: Dict[int, np.ndarray] = {}
+        for c in np.unique(self.labels).tolist():
+            indices = np.flatnonzero(self.labels == c)
+            np.random.shuffle(indices)
+            indices_classes[c] = indices
+        return indices_classes
 
-    def __generate_torch_node_data(self) -> Data:
-        Gn: nx.Graph = nx.convert_node_labels_to_integers(self.line_graph)
-        data = from_networkx(Gn)
+    def __features(self, n: int) -> torch.Tensor:
+        # Drawn from the global generator unless a seed is given
+        d = self.__embedding_dimension
+        if self.__feature_seed is not None:
+            return random_features(n, d, self.__feature_seed)
+        return torch.from_numpy(np.random.rand(n, d).astype(np.float32))
 
-        class_set = list(self.nodes_by_label.keys())
+    @property
+    def masks(self) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        # Train / validation / test masks of the edges, i.e. the line
+        # graph nodes, of a single split seeded from the global generator
+        if self.__masks is None:
+            seed = int(np.random.randint(2**31))
+            self.__masks = tuple(
+                masks[0] for masks in self.train_val_test_masks(1, seed)
+            )
+        return self.__masks
 
-        # Embedding dimension
-        n = Gn.number_of_nodes()
+    def __generate_torch_node_data(self) -> Data:
+        n = self.__graph.number_of_edges()
         d = self.__embedding_dimension
+        train_mask, val_mask, test_mask = self.masks
+        data = Data(
+            x=self.__features(n),
+            edge_index=self.line_graph_edge_index,
+            adj_t=self.__context.line_graph_adjacency,
+            y=torch.from_numpy(self.labels.astype(np.int64)),
+            train_mask=train_mask,
+            val_mask=val_mask,
+            test_mask=test_mask,
+        )
         data.num_features = d
-        data.num_classes = len(class_set)
-        data.x = torch.from_numpy(np.random.rand(n, d).astype(np.float32))
-
-        # Add labels and masks to data object
-        train_mask = np.zeros((n,), dtype=np.bool8)
-        test_mask = np.zeros((n,), dtype=np.bool8)
-        train_nodes, test_nodes = self.train_test_nodes
-        for k in train_nodes:
-            train_mask[k] = True
-        for k in test_nodes:
-            test_mask[k] = True
-
-        y = np.zeros((n,))
-        for c in class_set:
-            for k in self.nodes_by_label[c]:
-                y[k] = c
-
-        data.train_mask = torch.from_numpy(train_mask)
-        data.test_mask = torch.from_numpy(test_mask)
-        data.y = torch.from_numpy(y.astype(np.int64))
+        data.num_classes = len(self.nodes_by_label)
         return data
 
     def __generate_torch_edge_data(self) -> Data:
-        Gn: nx.Graph = nx.convert_node_labels_to_integers(self.__graph)
-        data = from_networkx(Gn)
-
-        # Embedding dimension
-        n = Gn.number_of_nodes()
+        # Node features of the graph itself. The labels, masks and
+        # features of its edges follow the order of canonical edges, as
+        # the line graph nodes of torch_node_data.
+        n = self.__graph.number_of_nodes()
         d = self.__embedding_dimension
+        train_mask, val_mask, test_mask = self.masks
+        data = Data(
+            x=self.__features(n),
+            edge_index=self.__context.edge_index,
+            adj_t=self.__context.adjacency,
+            edge_label_index=torch.from_numpy(self.edges.T.astype(np.int64)),
+            edge_features=torch.from_numpy(self.__context.edge_features),
+            y=torch.from_numpy(self.labels.astype(np.int64)),
+            train_mask=train_mask,
+            val_mask=val_mask,
+            test_mask=test_mask,
+        )
         data.num_features = d
-        data.x = torch.from_numpy(np.random.rand(n, d).astype(np.float32))
-
+        data.num_classes = len(self.nodes_by_label)
         return data
 
+    def train_val_test_masks(
+        self, num_evals: int, seed: int = 0, val_fraction: float = 0.2
+    ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        return stratified_split_masks(
+            self.labels, self.__train_split, num_evals, seed, val_fraction
+        )
+
     def shuffle(self):
         self.__nodes_by_label = None
-        self.__train_test_nodes = None
+        self.__masks = None
         self.__torch_node_data = None
 
     @property
@@ -203,57 +193,55 @@ class Preprocessing:
         return self.__graph
 
     @property
-    def line_graph(self) -> nx.Graph:
-        return self.__line_graph
+    def context(self) -> GraphContext:
+        return self.__context
+
+    @property
+    def line_graph_edge_index(self) -> torch.Tensor:
+        return self.__context.line_graph_edge_index
+
+    @property
+    def edges(self) -> np.ndarray:
+        return self.__context.edges
 
     @property
-    def criticality(self) -> Dict[tuple, float]:
-        if self.__criticality is None:
-            self.__criticality = self.__read_criticality()
-        return self.__criticality
+    def criticality(self) -> np.ndarray:
+        return self.__context.criticality(self.__criticality_edge_file)
 
     @property
-    def nodes_labels(self) -> Dict[tuple, int]:
-        if self.__nodes_labels is None:
-            classes = self.__generate_labels()
-            self.__nodes_labels = self.__canonical_relabeling_nodes(classes)
-        return self.__nodes_labels
+    def labels(self) -> np.ndarray:
+        if self.__labels is None:
+            self.__labels = self.__generate_labels()
+        return self.__labels
 
     @property
-    def edges_labels(self) -> Dict[tuple, int]:
+    def nodes_labels(self) -> np.ndarray:
+        # Line graph node k is the edge k of the graph
+        return self.labels
+
+    @property
+    def edges_labels(self) -> Dict[Tuple[int, int], int]:
         if self.__edges_labels is None:
-            classes = self.__generate_labels()
-            self.__edges_labels = self.__canonical_relabeling_edges(classes)
+            self.__edges_labels = dict(
+                zip(map(tuple, self.edges.tolist()), self.labels.tolist())
+            )
         return self.__edges_labels
 
     @property
     def nodes_by_label(self) -> Dict[int, np.ndarray]:
         if self.__nodes_by_label is None:
-            self.__nodes_by_label = self.__divide_nodes_in_classes(
-                self.nodes_labels
-            )
+            self.__nodes_by_label = self.__divide_in_classes()
         return self.__nodes_by_label
 
     @property
     def edges_by_label(self) -> Dict[int, np.ndarray]:
         if self.__edges_by_label is None:
-            self.__edges_by_label = self.__divide_edges_in_classes(
-                self.edges_labels
-            )
+            self.__edges_by_label = {
+                c: self.edges[indices]
+                for c, indices in self.__divide_in_classes().items()
+            }
         return self.__edges_by_label
 
-    @property
-    def train_test_nodes(self) -> Tuple[List[int], List[int]]:
-        if self.__train_test_nodes is None:
-            self.__train_test_nodes = self.__split_nodes(self.nodes_by_label)
-        return self.__train_test_nodes
-
-    @property
-    def train_test_edges(self) -> Tuple[List[int], List[int]]:
-        if self.__train_test_edges is None:
-            self.__train_test_edges = self.__split_edges(self.edges_by_label)
-        return self.__train_test_edges
-
     @property
     def torch_node_data(self) -> Data:
         if self.__torch_node_data is None:
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import random
+import zlib
+import numpy as np
+import pandas as pd
+import torch
+from functools import partial
+from multiprocessing import Pool
+from os.path import isfile, join
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+# A cell of the experiment grid, as (k, tol, train_split, eval). Scripts
+# that train all the evals of a combination together use eval = 0. The
+# results of a task are report DataFrames, or other picklable objects,
+# by name.
+Task = Tuple[int, float, float, int]
+Shards = Dict[str, Any]
+
+
+def task_key(task: Task) -> str:
+    k, tol, train_split, eval = task
+    return f"k{k}_tol{tol}_split{train_split}_eval{eval}"
+
+
+def task_seed(task: Task, base_seed: int = 0) -> int:
+    # Depends only on the cell, so that its results do not depend on
+    # the order or the process in which the tasks are run
+    return zlib.crc32(f"{base_seed}_{task_key(task)}".encode())
+
+
+def config_hash(config: Dict[str, Any]) -> str:
+    # Of the parameters by name, independent of their order
+    text = json.dumps(config, sort_keys=True, default=repr)
+    return hashlib.sha1(text.encode()).hexdigest()[:12]
+
+
+def seed_everything(seed: int) -> None:
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+
+class TaskLedger:
+    # Durable record of the finished tasks of a sweep. The shards of a
+    # task are written to the directory as soon as it completes, and
+    # only then its key is appended to the ledger, so that a rerun
+    # after an interruption loads them instead of running the task.
+    # With a config, the run parameters that the task keys leave out,
+    # the ledger is kept in a subdirectory named after its hash, so
+    # that shards of another configuration are never reused.
+    def __init__(
+        self, directory: str, config: Optional[Dict[str, Any]] = None
+    ) -> None:
+        self.__config = config
+        if config is not None:
+            directory = join(directory, config_hash(config))
+        self.__directory = directory
+        self.__ledger_file = join(directory, "ledger.txt")
+        self.__completed: Optional[Dict[str, List[str]]] = None
+
+    def __read(self) -> Dict[str, List[str]]:
+        completed: Dict[str, List[str]] = {}
+        if isfile(self.__ledger_file):
+            with open(self.__ledger_file) as f:
+                for line in f:
+                    key, _, names = line.rstrip("\n").partition("\t")
+                    completed[key] = names.split(",") if names else []
+        return completed
+
+    @property
+    def completed(self) -> Set[str]:
+        if self.__completed is None:
+            self.__completed = self.__read()
+        return set(self.__completed.keys())
+
+    def shard_file(self, task: Task, name: str) -> str:
+        return join(self.__directory, f"{task_key(task)}_{name}.pkl")
+
+    @property
+    def directory(self) -> str:
+        return self.__directory
+
+    def save(self, task: Task, shards: Shards) -> None:
+        os.makedirs(self.__directory, exist_ok=True)
+        config_file = join(self.__directory, "config.json")
+        if self.__config is not None and not isfile(config_file):
+            with open(config_file, "w") as f:
+                json.dump(self.__config, f, indent=2, default=repr)
+        # The shards, and their names in the directory, are on disk
+        # before the ledger lists the task
+        for name, shard in shards.items():
+            filename = self.shard_file(task, name)
+            with open(f"{filename}.tmp", "wb") as f:
+                pd.to_pickle(shard, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(f"{filename}.tmp", filename)
+        directory = os.open(self.__directory, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+        names = list(shards.keys())
+        with open(self.__ledger_file, "a") as f:
+            f.write(f"{task_key(task)}\t{','.join(names)}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        if self.__completed is not None:
+            self.__completed[task_key(task)] = names
+
+    def load(self, task: Task) -> Shards:
+        if self.__completed is None:
+            self.__completed = self.__read()
+        return {
+            name: pd.read_pickle(self.shard_file(task, name))
+            for name in self.__completed[task_key(task)]
+        }
+
+
+def _init_worker(num_threads: int) -> None:
+    torch.set_num_threads(num_threads)
+
+
+def _run_task(
+    run: Callable[[Task], Shards], task: Task, base_seed: int
+) -> Tuple[Task, Shards]:
+    seed_everything(task_seed(task, base_seed))
+    return task, run(task)
+
+
+class SweepRunner:
+    # Runs each task of a sweep with its own derived seed, on a pool of
+    # num_workers processes whose torch threads share the available
+    # cores. The run function returns the report shards of its task by
+    # name, which run() yields in the order of the tasks. With a ledger,
+    # tasks finished by a previous run are loaded instead of run.
+    def __init__(
+        self,
+        run: Callable[[Task], Shards],
+        num_workers: int = 1,
+        base_seed: int = 0,
+        ledger: Optional[TaskLedger] = None,
+    ) -> None:
+        self.__run = run
+        self.__num_workers = num_workers
+        self.__base_seed = base_seed
+        self.__ledger = ledger
+
+    @property
+    def num_workers(self) -> int:
+        return self.__num_workers
+
+    @property
+    def threads_per_worker(self) -> int:
+        return max(1, (os.cpu_count() or 1) // self.__num_workers)
+
+    def __run_tasks(
+        self, pool: Optional[Pool], tasks: List[Task]
+    ) -> Iterator[Tuple[Task, Shards]]:
+        run_task = partial(_run_task, self.__run, base_seed=self.__base_seed)
+        if pool is None:
+            return map(run_task, tasks)
+        return pool.imap_unordered(run_task, tasks)
+
+    def __shards(
+        self, pool: Optional[Pool], tasks: List[Task]
+    ) -> Iterator[Shards]:
+        # Tasks are saved to the ledger as soon as they finish, in any
+        # order, but their shards are yielded in the order of the tasks
+        completed = (
+            self.__ledger.completed if self.__ledger is not None else set()
+        )
+        pending = [task for task in tasks if task_key(task) not in completed]
+        results = self.__run_tasks(pool, pending)
+        ready: Dict[str, Shards] = {}
+        for task in tasks:
+            key = task_key(task)
+            if key in completed:
+                yield self.__ledger.load(task)
+                continue
+            while key not in ready:
+                finished, shards = next(results)
+                if self.__ledger is not None:
+                    self.__ledger.save(finished, shards)
+                ready[task_key(finished)] = shards
+            yield ready.pop(key)
+
+    def run(self, tasks: List[Task]) -> Iterator[Shards]:
+        if self.__num_workers == 1:
+            yield from self.__shards(None, tasks)
+        else:
+            with Pool(
+                processes=self.__num_workers,
+                initializer=_init_worker,
+                initargs=(self.threads_per_worker,),
+            ) as pool:
+                yield from self.__shards(pool, tasks)
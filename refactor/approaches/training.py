@@ -0,0 +1,81 @@
+import numpy as np
+import torch
+from typing import Dict, Optional, Union
+
+
+class EarlyStopping:
+    # Patience based early stopping on the validation loss of num_runs
+    # independent runs trained together, e.g. the replicas of a
+    # BatchedCLG, whose parameters are stacked along their first
+    # dimension. A run stops when its loss has not improved by more
+    # than min_delta for patience epochs, but never before min_epochs.
+    # The parameters of each run at its best epoch are kept in memory
+    # and loaded back into the model by restore().
+    def __init__(
+        self,
+        model: torch.nn.Module,
+        patience: int = 50,
+        min_epochs: int = 100,
+        min_delta: float = 0.0,
+        num_runs: int = 1,
+    ) -> None:
+        self.__model = model
+        self.__patience = patience
+        self.__min_epochs = min_epochs
+        self.__min_delta = min_delta
+        self.__num_runs = num_runs
+        self.__best_losses = np.full((num_runs,), np.inf)
+        self.__best_epochs = np.zeros((num_runs,), dtype=np.int64)
+        self.__epochs = np.zeros((num_runs,), dtype=np.int64)
+        self.__active = np.ones((num_runs,), dtype=bool)
+        self.__best_state: Optional[Dict[str, torch.Tensor]] = None
+
+    def __save(self, improved: np.ndarray) -> None:
+        state = self.__model.state_dict()
+        if self.__best_state is None or self.__num_runs == 1:
+            self.__best_state = {
+                name: value.detach().clone() for name, value in state.items()
+            }
+        else:
+            rows = torch.from_numpy(improved)
+            for name, value in state.items():
+                self.__best_state[name][rows] = value.detach()[rows]
+
+    def step(self, epoch: int, val_losses: Union[float, np.ndarray]) -> bool:
+        losses = np.atleast_1d(np.asarray(val_losses, dtype=np.float64))
+        improved = self.__active & (
+            losses < self.__best_losses - self.__min_delta
+        )
+        if improved.any():
+            self.__save(improved)
+            self.__best_losses[improved] = losses[improved]
+            self.__best_epochs[improved] = epoch
+        self.__epochs[self.__active] = epoch
+        exhausted = epoch - self.__best_epochs >= self.__patience
+        if epoch >= self.__min_epochs:
+            self.__active &= ~exhausted
+        return self.stopped
+
+    def restore(self) -> None:
+        if self.__best_state is not None:
+            self.__model.load_state_dict(self.__best_state)
+
+    @property
+    def stopped(self) -> bool:
+        return not self.__active.any()
+
+    @property
+    def active(self) -> np.ndarray:
+        return self.__active
+
+    @property
+    def epochs(self) -> np.ndarray:
+        return self.__epochs
+
+    @property
+    def best_epochs(self) -> np.ndarray:
+        return self.__best_epochs
+
+    @property
+    def best_losses(self) -> np.ndarray:
+        return self.__best_losses
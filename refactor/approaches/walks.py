@@ -0,0 +1,141 @@
+import hashlib
+import os
+import numpy as np
+import torch
+from functools import partial
+from multiprocessing import Pool
+from os.path import isfile
+from typing import Optional
+from torch_geometric.index import index2ptr
+from torch_geometric.utils import sort_edge_index
+
+from refactor.utils.files import walk_corpus_file
+
+
+def graph_hash(edge_index: torch.Tensor, num_nodes: int) -> str:
+    # Independent of the order of the columns of edge_index
+    edges = edge_index.numpy().astype(np.int64)
+    order = np.lexsort((edges[1], edges[0]))
+    digest = hashlib.sha1(np.int64(num_nodes).tobytes())
+    digest.update(np.ascontiguousarray(edges[:, order]).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def context_windows(walks: torch.Tensor, context_size: int) -> torch.Tensor:
+    # Positive samples of Node2Vec.loss from a (walks x nodes) array of
+    # walks, as Node2Vec.pos_sample splits them
+    num_windows = walks.size(1) + 1 - context_size
+    return torch.cat(
+        [walks[:, j : j + context_size] for j in range(num_windows)], dim=0
+    )
+
+
+def _sample_epoch(
+    rowptr: torch.Tensor,
+    col: torch.Tensor,
+    walk_length: int,
+    walks_per_node: int,
+    p: float,
+    q: float,
+    seed: int,
+) -> np.ndarray:
+    # torch.ops.pyg.random_walk comes with pyg-lib, as for Node2Vec, and
+    # draws from the global generator, which is restored afterwards. Walks
+    # of walk_length steps have walk_length + 1 nodes, as in Node2Vec.
+    start = torch.arange(rowptr.numel() - 1).repeat(walks_per_node)
+    with torch.random.fork_rng(devices=[]):
+        torch.manual_seed(seed)
+        walks = torch.ops.pyg.random_walk(
+            rowptr, col, start, walk_length, p, q
+        )
+    if not isinstance(walks, torch.Tensor):
+        walks = walks[0]
+    return walks.numpy().astype(np.int32)
+
+
+class WalkCorpus:
+    # Node2Vec random walks of num_epochs epochs, sampled once by
+    # num_workers processes as an int32 (epoch x walk x walk_length + 1)
+    # array, walks_per_node from each node per epoch. With a directory
+    # the array is saved under a key of the graph and the walk
+    # parameters and memory mapped, so that the evals of a sweep, and
+    # later sweeps, reuse it instead of sampling walks on every epoch.
+    def __init__(
+        self,
+        edge_index: torch.Tensor,
+        num_nodes: int,
+        walk_length: int,
+        walks_per_node: int,
+        p: float,
+        q: float,
+        num_epochs: int,
+        directory: Optional[str] = None,
+        num_workers: int = 1,
+        seed: int = 0,
+    ) -> None:
+        self.__edge_index = edge_index
+        self.__num_nodes = num_nodes
+        self.__walk_length = walk_length
+        self.__walks_per_node = walks_per_node
+        self.__p = p
+        self.__q = q
+        self.__num_epochs = num_epochs
+        self.__directory = directory
+        self.__num_workers = num_workers
+        self.__seed = seed
+        self.__walks: Optional[np.ndarray] = None
+
+    @property
+    def key(self) -> str:
+        return (
+            f"{graph_hash(self.__edge_index, self.__num_nodes)}"
+            + f"_p{self.__p}_q{self.__q}_steps{self.__walk_length}"
+            + f"_walks{self.__walks_per_node}_epochs{self.__num_epochs}"
+            + f"_seed{self.__seed}"
+        )
+
+    def __sample(self) -> np.ndarray:
+        # Each epoch has its own seed, so that the corpus does not
+        # depend on the number of workers
+        row, col = sort_edge_index(
+            self.__edge_index, num_nodes=self.__num_nodes
+        )
+        rowptr = index2ptr(row, self.__num_nodes)
+        sample = partial(
+            _sample_epoch,
+            rowptr,
+            col,
+            self.__walk_length,
+            self.__walks_per_node,
+            self.__p,
+            self.__q,
+        )
+        seeds = [self.__seed + epoch for epoch in range(self.__num_epochs)]
+        if self.__num_workers > 1:
+            with Pool(self.__num_workers) as pool:
+                return np.stack(pool.map(sample, seeds))
+        return np.stack([sample(seed) for seed in seeds])
+
+    @property
+    def walks(self) -> np.ndarray:
+        if self.__walks is None:
+            if self.__directory is None:
+                self.__walks = self.__sample()
+            else:
+                filename = walk_corpus_file(self.__directory, self.key)
+                if not isfile(filename):
+                    os.makedirs(os.path.dirname(filename), exist_ok=True)
+                    with open(f"{filename}.tmp", "wb") as f:
+                        np.save(f, self.__sample())
+                    os.replace(f"{filename}.tmp", filename)
+                self.__walks = np.load(filename, mmap_mode="r")
+        return self.__walks
+
+    def __len__(self) -> int:
+        return self.__num_epochs
+
+    def epoch(self, epoch: int) -> torch.Tensor:
+        # Walks of the epoch, counted from 1, wrapping around when
+        # training runs longer than the corpus
+        walks = self.walks[(epoch - 1) % self.__num_epochs]
+        return torch.from_numpy(walks.astype(np.int64))
@@ -8,6 +8,7 @@ import torch.nn.functional as F
 from torch_geometric.utils.convert import from_networkx
 from torch_geometric.nn import GCNConv
 import matplotlib.pyplot as plt
+from refactor.utils.graphs import normalized_adjacency
 from contingency.models.network import Network
 from contingency.controllers.screener import ExhaustiveScreener
 
@@ -130,6 +131,7 @@ d = 32
 data.num_features = d
 data.num_classes = len(class_set)
 data.x = torch.from_numpy(np.random.rand(n, d).astype(np.float32))
+data.adj_t = normalized_adjacency(data.edge_index, n)
 
 # Add labels and masks to data object
 train_mask = np.zeros((n,), dtype=np.bool8)
@@ -157,14 +159,18 @@ class GCN(torch.nn.Module):
     def __init__(self, hidden_channels):
         super().__init__()
         torch.manual_seed(1234567)
-        self.conv1 = GCNConv(data.num_features, hidden_channels)
-        self.conv2 = GCNConv(hidden_channels, data.num_classes)
+        self.conv1 = GCNConv(
+            data.num_features, hidden_channels, normalize=False
+        )
+        self.conv2 = GCNConv(
+            hidden_channels, data.num_classes, normalize=False
+        )
 
-    def forward(self, x, edge_index):
-        x = self.conv1(x, edge_index)
+    def forward(self, x, adj_t):
+        x = self.conv1(x, adj_t)
         x = x.relu()
         x = F.dropout(x, p=0.5, training=self.training)
-        x = self.conv2(x, edge_index)
+        x = self.conv2(x, adj_t)
         return x
 
 
@@ -177,7 +183,7 @@ n_epochs = 100
 def train():
     model.train()
     optimizer.zero_grad()  # Clear gradients.
-    out = model(data.x, data.edge_index)  # Perform a single forward pass.
+    out = model(data.x, data.adj_t)  # Perform a single forward pass.
     loss = criterion(
         out[data.train_mask], data.y[data.train_mask]
     )  # Compute the loss solely based on the training nodes.
@@ -188,7 +194,7 @@ def train():
 
 def test():
     model.eval()
-    out = model(data.x, data.edge_index)
+    out = model(data.x, data.adj_t)
     pred = out.argmax(dim=1)  # Use the class with highest probability.
     test_correct = (
         pred[data.test_mask] == data.y[data.test_mask]
@@ -207,5 +213,5 @@ for epoch in range(1, n_epochs + 1):
 test_acc = test()
 print(f"Test Accuracy: {test_acc:.4f}")
 model.eval()
-out = model(data.x, data.edge_index)
+out = model(data.x, data.adj_t)
 visualize(out, color=data.y)
@@ -0,0 +1,187 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.format import open_memmap
+from os import makedirs
+from os.path import isdir, join
+from typing import Dict, List, Optional, Tuple
+
+
+class EmbeddingRuns:
+    # Embedding snapshots of the runs of one sweep task, with the
+    # parameters of each run as a row of a DataFrame. Runs stopped early
+    # have their missing epochs set to -1.
+    def __init__(
+        self,
+        parameters: pd.DataFrame,
+        epochs: np.ndarray,
+        labels: np.ndarray,
+        embeddings: np.ndarray,
+    ) -> None:
+        self.__parameters = parameters.reset_index(drop=True)
+        self.__epochs = epochs.astype(np.int64)
+        self.__labels = labels.astype(np.int8)
+        self.__embeddings = embeddings.astype(np.float32, copy=False)
+
+    @property
+    def parameters(self) -> pd.DataFrame:
+        return self.__parameters
+
+    @property
+    def epochs(self) -> np.ndarray:
+        # (run x epoch)
+        return self.__epochs
+
+    @property
+    def labels(self) -> np.ndarray:
+        # (run x item)
+        return self.__labels
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        # (run x epoch x item x d)
+        return self.__embeddings
+
+
+class EmbeddingStore:
+    # Embedding snapshots of a sweep as a float32 (run x epoch x item x d)
+    # .npy file, with the epochs and item labels of each run and an
+    # index of the run parameters. When a shape is given the store is
+    # created for writing, otherwise the arrays are memory mapped read
+    # only, so that a slice of a run and epoch reads only its bytes.
+    def __init__(
+        self,
+        directory: str,
+        shape: Optional[Tuple[int, int, int, int]] = None,
+    ) -> None:
+        self.__directory = directory
+        self.__embeddings: Optional[np.ndarray] = None
+        self.__epochs: Optional[np.ndarray] = None
+        self.__labels: Optional[np.ndarray] = None
+        self.__index: Optional[pd.DataFrame] = None
+        self.__parameters: List[pd.DataFrame] = []
+        self.__num_runs = 0
+        self.__writable = shape is not None
+        if shape is not None:
+            self.__create(shape)
+
+    def __path(self, name: str) -> str:
+        return join(self.__directory, name)
+
+    def __create(self, shape: Tuple[int, int, int, int]) -> None:
+        if not isdir(self.__directory):
+            makedirs(self.__directory)
+        num_runs, num_epochs, num_items, _ = shape
+        self.__embeddings = open_memmap(
+            self.__path("embeddings.npy"),
+            mode="w+",
+            dtype=np.float32,
+            shape=shape,
+        )
+        self.__epochs = open_memmap(
+            self.__path("epochs.npy"),
+            mode="w+",
+            dtype=np.int64,
+            shape=(num_runs, num_epochs),
+        )
+        self.__epochs[:] = -1
+        self.__labels = open_memmap(
+            self.__path("labels.npy"),
+            mode="w+",
+            dtype=np.int8,
+            shape=(num_runs, num_items),
+        )
+
+    def __array(self, name: str) -> np.ndarray:
+        return np.load(self.__path(f"{name}.npy"), mmap_mode="r")
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        if self.__embeddings is None:
+            self.__embeddings = self.__array("embeddings")
+        return self.__embeddings
+
+    @property
+    def epochs(self) -> np.ndarray:
+        if self.__epochs is None:
+            self.__epochs = self.__array("epochs")
+        return self.__epochs
+
+    @property
+    def labels(self) -> np.ndarray:
+        if self.__labels is None:
+            self.__labels = self.__array("labels")
+        return self.__labels
+
+    @property
+    def index(self) -> pd.DataFrame:
+        if self.__index is None:
+            self.__index = pd.read_csv(self.__path("runs.csv"))
+        return self.__index
+
+    def append(self, runs: EmbeddingRuns) -> None:
+        begin = self.__num_runs
+        end = begin + runs.embeddings.shape[0]
+        num_epochs = runs.embeddings.shape[1]
+        self.embeddings[begin:end, :num_epochs] = runs.embeddings
+        self.epochs[begin:end, :num_epochs] = runs.epochs
+        self.labels[begin:end] = runs.labels
+        parameters = runs.parameters.copy()
+        parameters.insert(0, "run", np.arange(begin, end))
+        self.__parameters.append(parameters)
+        self.__num_runs = end
+
+    def close(self) -> None:
+        if not self.__writable:
+            return
+        for array in [self.__embeddings, self.__epochs, self.__labels]:
+            array.flush()
+        pd.concat(self.__parameters, ignore_index=True).to_csv(
+            self.__path("runs.csv"), index=False
+        )
+        self.__writable = False
+
+    def __enter__(self) -> "EmbeddingStore":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def runs(self, **parameters) -> np.ndarray:
+        index = self.index
+        mask = np.ones((len(index),), dtype=bool)
+        for name, value in parameters.items():
+            mask &= np.isclose(index[name].to_numpy(), value)
+        return index.loc[mask, "run"].to_numpy()
+
+    def run_epochs(self, run: int) -> np.ndarray:
+        epochs = self.epochs[run]
+        return epochs[epochs >= 0]
+
+    def snapshot(self, run: int, epoch: int) -> np.ndarray:
+        position = np.flatnonzero(self.epochs[run] == epoch)
+        if len(position) == 0:
+            raise KeyError(f"No snapshot of run {run} at epoch {epoch}")
+        return np.asarray(self.embeddings[run, position[0]])
+
+    def embeddings_with_labels(
+        self, run: int, epochs: Optional[List[int]] = None
+    ) -> pd.DataFrame:
+        # Snapshots of a run in the layout of the former embeddings
+        # report: z1..zd, label, epoch and the run parameters
+        epochs = self.run_epochs(run) if epochs is None else epochs
+        row = self.index.loc[self.index["run"] == run].drop(columns="run")
+        parameters: Dict[str, object] = {
+            name: row[name].iloc[0] for name in row.columns
+        }
+        dfs = []
+        for epoch in epochs:
+            z = self.snapshot(run, epoch)
+            df = pd.DataFrame(
+                z, columns=[f"z{d}" for d in range(1, z.shape[1] + 1)]
+            )
+            df["label"] = self.labels[run]
+            df["epoch"] = epoch
+            for name, value in parameters.items():
+                df[name] = value
+            dfs.append(df)
+        return pd.concat(dfs, ignore_index=True)
@@ -1,4 +1,8 @@
-from os.path import join
+from os import makedirs
+from os.path import abspath, basename, dirname, join, getmtime, splitext
+from typing import Optional, Tuple
+import numpy as np
+import pandas as pd
 
 
 def edgelist_file(basedir: str, graphname: str) -> str:
@@ -11,10 +15,64 @@ def criticality_file(basedir: str, graphname: str, k: str) -> str:
     )
 
 
+def criticality_cache_file(cache_dir: str, criticality_file: str) -> str:
+    # Named after the exaustivo_<graphname>_<k> directory of the csv
+    name = basename(dirname(abspath(criticality_file)))
+    stem = splitext(basename(criticality_file))[0]
+    return join(cache_dir, "criticality", f"{name}_{stem}.npz")
+
+
+def read_criticality(
+    filename: str, cache_dir: Optional[str] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Node labels are kept as the strings of the csv. With a cache_dir,
+    # the parsed arrays are cached in a binary file there, away from
+    # the input data, and reused while the modification time of the
+    # csv is unchanged.
+    mtime = getmtime(filename)
+    cache = (
+        criticality_cache_file(cache_dir, filename)
+        if cache_dir is not None
+        else None
+    )
+    if cache is not None:
+        try:
+            with np.load(cache) as cached:
+                if float(cached["mtime"]) == mtime:
+                    return cached["src"], cached["dst"], cached["delta"]
+        except (OSError, KeyError, ValueError):
+            pass
+    df = pd.read_csv(
+        filename,
+        header=None,
+        names=["src", "dst", "delta"],
+        dtype={"src": str, "dst": str, "delta": np.float64},
+    )
+    src = df["src"].to_numpy(dtype=str)
+    dst = df["dst"].to_numpy(dtype=str)
+    delta = df["delta"].to_numpy()
+    if cache is not None:
+        try:
+            makedirs(dirname(cache), exist_ok=True)
+            with open(cache, "wb") as f:
+                np.savez(f, src=src, dst=dst, delta=delta, mtime=mtime)
+        except OSError:
+            pass
+    return src, dst, delta
+
+
+def criticality_cache_dir(basedir: str) -> str:
+    return join(basedir, "cache")
+
+
 def embeddings_result_file(basedir: str, graphname: str) -> str:
     return join(basedir, f"{graphname}_embeddings.csv")
 
 
+def embeddings_store_dir(basedir: str, graphname: str) -> str:
+    return join(basedir, f"{graphname}_embeddings")
+
+
 def train_result_file(basedir: str, graphname: str) -> str:
     return join(basedir, f"{graphname}_train.csv")
 
@@ -31,6 +89,26 @@ def roc_result_file(basedir: str, graphname: str) -> str:
     return join(basedir, f"{graphname}_roc.csv")
 
 
+def model_artifact_file(
+    basedir: str, graphname: str, k: int, tol: float, train_split: float
+) -> str:
+    return join(
+        basedir, "models", f"{graphname}_k{k}_tol{tol}_split{train_split}.pt"
+    )
+
+
+def columnar_file(result_file: str) -> str:
+    return f"{splitext(result_file)[0]}.parquet"
+
+
+def walk_corpus_file(basedir: str, key: str) -> str:
+    return join(basedir, "walks", f"{key}.npy")
+
+
+def sweep_shard_dir(basedir: str, graphname: str) -> str:
+    return join(basedir, "shards", graphname)
+
+
 def roc_curve_file(basedir: str, graphname: str, parameter_sufix: str) -> str:
     return join(basedir, "roc_auc", f"{graphname}_{parameter_sufix}.png")
 
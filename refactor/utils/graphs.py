@@ -0,0 +1,158 @@
+import networkx as nx
+import numpy as np
+import scipy.sparse as sp
+import torch
+from scipy.sparse.csgraph import breadth_first_order, connected_components
+from scipy.sparse.linalg import eigsh
+from torch_geometric.nn.conv.gcn_conv import gcn_norm
+
+
+def canonical_edges(graph: nx.Graph) -> np.ndarray:
+    # Edges in the order of graph.edges, with their endpoints numbered
+    # in the order of graph.nodes
+    nodes = {n: i for i, n in enumerate(graph.nodes)}
+    return np.array(
+        [(nodes[u], nodes[v]) for u, v in graph.edges], dtype=np.int32
+    ).reshape(-1, 2)
+
+
+def _label_index(
+    labels: np.ndarray, sorter: np.ndarray, values: np.ndarray
+) -> np.ndarray:
+    positions = np.searchsorted(labels, values, sorter=sorter)
+    index = sorter[np.minimum(positions, len(labels) - 1)]
+    if not np.array_equal(labels[index], values):
+        raise KeyError("Node labels not in the graph")
+    return index
+
+
+def align_edge_values(
+    graph: nx.Graph, src: np.ndarray, dst: np.ndarray, values: np.ndarray
+) -> np.ndarray:
+    # Reorders values given for (src, dst) node labels, in any
+    # orientation, to the order of canonical_edges. The labels are
+    # compared as strings, as nx.read_edgelist reads them.
+    labels = np.array([str(n) for n in graph.nodes])
+    src = np.asarray(src).astype(str)
+    dst = np.asarray(dst).astype(str)
+    sorter = np.argsort(labels)
+    src_index = _label_index(labels, sorter, src)
+    dst_index = _label_index(labels, sorter, dst)
+    n = len(labels)
+    keys = np.minimum(src_index, dst_index) * n + np.maximum(
+        src_index, dst_index
+    )
+    edges = canonical_edges(graph).astype(np.int64)
+    edge_keys = edges.min(axis=1) * n + edges.max(axis=1)
+    key_sorter = np.argsort(keys)
+    positions = np.searchsorted(keys, edge_keys, sorter=key_sorter)
+    rows = key_sorter[np.minimum(positions, len(keys) - 1)]
+    if not np.array_equal(keys[rows], edge_keys):
+        raise ValueError("Values are not given for every edge")
+    return values[rows]
+
+
+def line_graph_edge_index(graph: nx.Graph) -> torch.Tensor:
+    # Nodes of the line graph follow the order of graph.edges, and two
+    # of them are adjacent when the edges share an endpoint. Off the
+    # diagonal, B^T B counts the shared endpoints for the unsigned
+    # incidence matrix B, while its diagonal is always 2.
+    edges = canonical_edges(graph)
+    n = graph.number_of_nodes()
+    m = edges.shape[0]
+    columns = np.repeat(np.arange(m), 2)
+    B = sp.csr_matrix(
+        (np.ones(2 * m, dtype=np.int8), (edges.flatten(), columns)),
+        shape=(n, m),
+    )
+    L = (B.T @ B).tocoo()
+    off_diagonal = L.row != L.col
+    edge_index = np.vstack([L.row[off_diagonal], L.col[off_diagonal]])
+    order = np.lexsort((edge_index[1], edge_index[0]))
+    return torch.from_numpy(edge_index[:, order].astype(np.int64))
+
+
+def normalized_adjacency(
+    edge_index: torch.Tensor, num_nodes: int
+) -> torch.Tensor:
+    # GCN normalized adjacency D^-1/2 (A + I) D^-1/2 as a CSR tensor,
+    # stored transposed (row = target) as GCNConv expects for adj_t
+    edge_index, edge_weight = gcn_norm(edge_index, num_nodes=num_nodes)
+    return (
+        torch.sparse_coo_tensor(
+            edge_index.flip(0), edge_weight, (num_nodes, num_nodes)
+        )
+        .coalesce()
+        .to_sparse_csr()
+    )
+
+
+def _adjacency_matrix(
+    edge_index: torch.Tensor, num_nodes: int
+) -> sp.csr_matrix:
+    edges = edge_index.numpy()
+    return sp.csr_matrix(
+        (np.ones(edges.shape[1]), (edges[0], edges[1])),
+        shape=(num_nodes, num_nodes),
+    )
+
+
+def greedy_partition(
+    edge_index: torch.Tensor, num_nodes: int, num_parts: int, seed: int = 0
+) -> np.ndarray:
+    # Nodes in breadth first order from a random root of each connected
+    # component, cut into num_parts runs of consecutive nodes of equal
+    # size, so that each part is a few adjacent BFS layers
+    A = _adjacency_matrix(edge_index, num_nodes)
+    rng = np.random.default_rng(seed)
+    _, components = connected_components(A, directed=False)
+    order = []
+    for component in np.unique(components):
+        root = rng.choice(np.flatnonzero(components == component))
+        order.append(
+            breadth_first_order(
+                A, root, directed=False, return_predecessors=False
+            )
+        )
+    parts = np.empty((num_nodes,), dtype=np.int64)
+    parts[np.concatenate(order)] = (
+        np.arange(num_nodes) * num_parts // num_nodes
+    )
+    return parts
+
+
+def _fiedler_vector(A: sp.csr_matrix, seed: int) -> np.ndarray:
+    # Second eigenvector of the normalized Laplacian, taken as the
+    # second largest one of I + D^-1/2 A D^-1/2, whose top eigenvalues
+    # converge faster than the smallest of the Laplacian
+    n = A.shape[0]
+    degrees = np.asarray(A.sum(axis=1)).ravel()
+    inv_sqrt = np.zeros((n,))
+    inv_sqrt[degrees > 0] = 1 / np.sqrt(degrees[degrees > 0])
+    D = sp.diags(inv_sqrt)
+    M = sp.identity(n) + D @ A @ D
+    if n < 64:
+        _, vectors = np.linalg.eigh(M.toarray())
+    else:
+        v0 = np.random.default_rng(seed).random(n)
+        _, vectors = eigsh(M, k=2, which="LA", v0=v0)
+    return inv_sqrt * vectors[:, -2]
+
+
+def spectral_partition(
+    edge_index: torch.Tensor, num_nodes: int, num_parts: int, seed: int = 0
+) -> np.ndarray:
+    # Recursive spectral bisection: the largest part is split in two
+    # halves at the median of its Fiedler vector until there are
+    # num_parts parts
+    A = _adjacency_matrix(edge_index, num_nodes)
+    parts = np.zeros((num_nodes,), dtype=np.int64)
+    for part in range(1, num_parts):
+        largest = np.bincount(parts).argmax()
+        nodes = np.flatnonzero(parts == largest)
+        if len(nodes) < 2:
+            break
+        fiedler = _fiedler_vector(A[nodes][:, nodes], seed)
+        order = np.argsort(fiedler, kind="stable")
+        parts[nodes[order[len(nodes) // 2 :]]] = part
+    return parts
@@ -0,0 +1,122 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from os import makedirs, remove
+from os.path import dirname, isdir, isfile
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from refactor.utils.files import columnar_file
+
+
+class ReportSink:
+    # Appends report DataFrames to a Parquet file. At most max_rows are
+    # kept in memory, and each flush writes them as one row group typed
+    # by the schema of the first DataFrame.
+    def __init__(self, filename: str, max_rows: int = 100000) -> None:
+        self.__filename = filename
+        self.__max_rows = max_rows
+        self.__buffer: List[pd.DataFrame] = []
+        self.__buffered_rows = 0
+        self.__schema: Optional[pa.Schema] = None
+        self.__writer: Optional[pq.ParquetWriter] = None
+
+    @property
+    def filename(self) -> str:
+        return self.__filename
+
+    def append(self, df: pd.DataFrame) -> None:
+        if df.empty:
+            return
+        self.__buffer.append(df)
+        self.__buffered_rows += len(df)
+        if self.__buffered_rows >= self.__max_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        if len(self.__buffer) == 0:
+            return
+        df = pd.concat(self.__buffer, ignore_index=True)
+        table = pa.Table.from_pandas(
+            df, schema=self.__schema, preserve_index=False
+        )
+        if self.__writer is None:
+            self.__schema = table.schema
+            directory = dirname(self.__filename)
+            if directory and not isdir(directory):
+                makedirs(directory)
+            self.__writer = pq.ParquetWriter(self.__filename, self.__schema)
+        self.__writer.write_table(table)
+        self.__buffer = []
+        self.__buffered_rows = 0
+
+    def close(self) -> None:
+        self.flush()
+        if self.__writer is not None:
+            self.__writer.close()
+            self.__writer = None
+        elif isfile(self.__filename):
+            # Nothing was reported, so results of a previous run are stale
+            remove(self.__filename)
+
+    def __enter__(self) -> "ReportSink":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class ReportWriter:
+    # One ReportSink for each named report, fed with the report shards
+    # returned by the sweep tasks
+    def __init__(self, filenames: Dict[str, str], max_rows: int = 100000):
+        self.__sinks = {
+            name: ReportSink(filename, max_rows)
+            for name, filename in filenames.items()
+        }
+
+    def write(self, shards: Dict[str, pd.DataFrame]) -> None:
+        for name, df in shards.items():
+            self.__sinks[name].append(df)
+
+    def close(self) -> None:
+        for sink in self.__sinks.values():
+            sink.close()
+
+    def __enter__(self) -> "ReportWriter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def read_report(
+    filename: str,
+    columns: Optional[List[str]] = None,
+    filters: Optional[List[Tuple[str, str, Any]]] = None,
+) -> pd.DataFrame:
+    # Reads the columnar version of a report when there is one, loading
+    # only the given columns and the row groups that can match filters,
+    # and the csv written by older runs otherwise
+    parquet = columnar_file(filename)
+    if isfile(parquet):
+        return pd.read_parquet(parquet, columns=columns, filters=filters)
+    df = pd.read_csv(filename, index_col=0)
+    if filters is not None:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        df = table.filter(pq.filters_to_expression(filters)).to_pandas()
+    return df if columns is None else df[columns]
+
+
+def iter_report(
+    filename: str,
+    batch_size: int = 100000,
+    columns: Optional[List[str]] = None,
+) -> Iterator[pd.DataFrame]:
+    parquet = columnar_file(filename)
+    if not isfile(parquet):
+        yield from pd.read_csv(filename, index_col=0, chunksize=batch_size)
+        return
+    for batch in pq.ParquetFile(parquet).iter_batches(
+        batch_size=batch_size, columns=columns
+    ):
+        yield batch.to_pandas()
@@ -80,8 +80,6 @@ def training_embeddings_scatter(
     unique_values = {
         c: df[c].unique().tolist() for c in parameter_cols if c != "epoch"
     }
-    epochs = df["epoch"].unique().tolist()
-    epochs_plot = [min(epochs), max(epochs)]
     combinations = list(product(*[v for v in unique_values.values()]))
     for c in combinations:
         fig, axs = plt.subplots(1, 2, figsize=(10, 5))
@@ -90,6 +88,11 @@ def training_embeddings_scatter(
         col_filters = {
             k: df[k] == v for k, v in zip(list(unique_values.keys()), c)
         }
+        # Runs stopped early have their own last epoch
+        epochs = df.loc[
+            pd.DataFrame(data=col_filters).all(axis=1), "epoch"
+        ].unique()
+        epochs_plot = [min(epochs), max(epochs)]
         for i, epoch in enumerate(epochs_plot):
             col_filters["epoch"] = df["epoch"] == epoch
             df_filter = pd.DataFrame(data=col_filters).all(axis=1)
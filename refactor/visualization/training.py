@@ -11,11 +11,14 @@ plt.rcParams["font.size"] = "12"
 
 
 def stacked_train_curve(basedir: str, graphname: str, df: pd.DataFrame):
-    parameter_cols = [
-        c
-        for c in list(df.columns)
-        if c not in ["epoch", "train_loss", "val_loss"]
+    value_cols = [
+        "epoch",
+        "train_loss",
+        "val_loss",
+        "num_epochs",
+        "best_epoch",
     ]
+    parameter_cols = [c for c in list(df.columns) if c not in value_cols]
     unique_values = {
         c: df[c].unique().tolist() for c in parameter_cols if c != "eval"
     }
@@ -39,9 +42,11 @@ def stacked_train_curve(basedir: str, graphname: str, df: pd.DataFrame):
                 color="blue",
                 label="train",
             )
+            # Epochs that were not validated have a nan val_loss
+            df_val = df_plot.loc[df_plot["val_loss"].notna(), :]
             ax.plot(
-                df_plot["epoch"].to_numpy().flatten(),
-                df_plot["val_loss"].to_numpy().flatten(),
+                df_val["epoch"].to_numpy().flatten(),
+                df_val["val_loss"].to_numpy().flatten(),
                 alpha=0.2,
                 color="red",
                 label="validation",
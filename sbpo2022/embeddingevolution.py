@@ -2,13 +2,15 @@ import warnings
 import pandas as pd
 import numpy as np
 from os import curdir
-from os.path import join
+from os.path import isdir, join
 from sklearn.manifold import TSNE
 import matplotlib.pyplot as plt
 from matplotlib.colors import ListedColormap
 from matplotlib.lines import Line2D
 
-from refactor.utils.files import embeddings_result_file
+from refactor.utils.files import embeddings_result_file, embeddings_store_dir
+from refactor.utils.embedding_store import EmbeddingStore
+from refactor.utils.reports import read_report
 
 GRAPHNAME = "ieee118"
 RESULT_BASEDIR = join(curdir, "results", "clg")
@@ -33,10 +35,6 @@ def _generate_embeddings_to_plot(df: pd.DataFrame) -> pd.DataFrame:
     return df_plot.loc[df_plot["label"] >= 0]
 
 
-df = pd.read_csv(
-    embeddings_result_file(RESULT_BASEDIR, GRAPHNAME), index_col=0
-)
-
 COLORS = np.array(
     [
         [0.5098039215686274, 0.5215686274509804, 0.5137254901960784, 1],
@@ -69,14 +67,30 @@ tol = 0.5
 train_split = 0.5
 eval = 30
 
+store_dir = embeddings_store_dir(RESULT_BASEDIR, GRAPHNAME)
+if isdir(store_dir):
+    # Only the first and last snapshots of the plotted run are read
+    store = EmbeddingStore(store_dir)
+    df = pd.concat(
+        [
+            store.embeddings_with_labels(run, store.run_epochs(run)[[0, -1]])
+            for run in store.runs(tol=tol, train_split=train_split, eval=eval)
+        ],
+        ignore_index=True,
+    )
+else:
+    df = read_report(embeddings_result_file(RESULT_BASEDIR, GRAPHNAME))
+
 embeddings_cols = [c for c in df.columns if "z" in c]
 common_filter = (
     (df["tol"] == tol)
     & (df["train_split"] == train_split)
-    & (df["eval"] == 30)
+    & (df["eval"] == eval)
 )
+# Runs stopped early have their last snapshot before the last epoch
+epochs = np.sort(df.loc[common_filter, "epoch"].unique())
 
-for epoch in [1, 300]:
+for epoch in [epochs[0], epochs[-1]]:
     df_epoch = df.loc[
         common_filter & (df["epoch"] == epoch), embeddings_cols + ["label"]
     ]
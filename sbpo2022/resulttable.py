@@ -4,18 +4,19 @@ from os import curdir
 from os.path import join
 
 from refactor.utils.files import class_result_file, auc_result_file
+from refactor.utils.reports import read_report
 
 
 RESULT_BASEDIR = join(curdir, "results", "clg")
 GRAPHS = ["ieee39", "ieee57", "ieee118", "ieee300"]
 
 dfs_class = {
-    g: pd.read_csv(class_result_file(RESULT_BASEDIR, g), index_col=0)
+    g: read_report(class_result_file(RESULT_BASEDIR, g))
     for g in GRAPHS
 }
 
 dfs_auc = {
-    g: pd.read_csv(auc_result_file(RESULT_BASEDIR, g), index_col=0)
+    g: read_report(auc_result_file(RESULT_BASEDIR, g))
     for g in GRAPHS
 }
 
@@ -1,5 +1,4 @@
 import warnings
-import pandas as pd
 import numpy as np
 from os import curdir
 from os.path import join
@@ -8,13 +7,14 @@ from matplotlib.colors import ListedColormap
 from matplotlib.lines import Line2D
 
 from refactor.utils.files import roc_result_file
+from refactor.utils.reports import read_report
 
 GRAPHNAME = "ieee300"
 RESULT_BASEDIR = join(curdir, "results", "clg")
 FIGURE_BASEDIR = join(RESULT_BASEDIR, "figures")
 
 
-df = pd.read_csv(roc_result_file(RESULT_BASEDIR, GRAPHNAME), index_col=0)
+df = read_report(roc_result_file(RESULT_BASEDIR, GRAPHNAME))
 
 COLORS = (
     np.array(
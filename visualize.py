@@ -1,9 +1,9 @@
 import sys
-import pandas as pd
 import numpy as np
+import pandas as pd
 import random
 from os import getenv
-from os.path import join
+from os.path import isdir, join
 from dotenv import load_dotenv
 
 from refactor.utils.files import (
@@ -11,7 +11,10 @@ from refactor.utils.files import (
     roc_result_file,
     class_result_file,
     embeddings_result_file,
+    embeddings_store_dir,
 )
+from refactor.utils.embedding_store import EmbeddingStore
+from refactor.utils.reports import read_report
 from refactor.visualization.training import stacked_train_curve
 from refactor.visualization.roc_auc import stacked_roc_curve
 from refactor.visualization.embeddings import training_embeddings_scatter
@@ -36,14 +39,10 @@ if __name__ == "__main__":
     RESULT_BASEDIR = join(getenv("RESULT_BASEDIR"), sys.argv[1])
     FIGURE_BASEDIR = join(RESULT_BASEDIR, "figures")
 
-    train_result = pd.read_csv(
-        train_result_file(RESULT_BASEDIR, GRAPHNAME), index_col=0
-    )
+    train_result = read_report(train_result_file(RESULT_BASEDIR, GRAPHNAME))
     stacked_train_curve(FIGURE_BASEDIR, GRAPHNAME, train_result)
 
-    class_result = pd.read_csv(
-        class_result_file(RESULT_BASEDIR, GRAPHNAME), index_col=0
-    )
+    class_result = read_report(class_result_file(RESULT_BASEDIR, GRAPHNAME))
     classification_metrics_bars(
         FIGURE_BASEDIR,
         GRAPHNAME,
@@ -52,12 +51,36 @@ if __name__ == "__main__":
         cols_to_plot=["macro avg_f1-score", "critical_f1-score"],
     )
 
-    roc_result = pd.read_csv(
-        roc_result_file(RESULT_BASEDIR, GRAPHNAME), index_col=0
-    )
+    roc_result = read_report(roc_result_file(RESULT_BASEDIR, GRAPHNAME))
     stacked_roc_curve(FIGURE_BASEDIR, GRAPHNAME, roc_result)
 
-    embeddings_result = pd.read_csv(
-        embeddings_result_file(RESULT_BASEDIR, GRAPHNAME), index_col=0
-    )
+    # Only the first and the last epoch of each run are plotted, so the
+    # embeddings of the other epochs are not loaded
+    store_dir = embeddings_store_dir(RESULT_BASEDIR, GRAPHNAME)
+    if isdir(store_dir):
+        store = EmbeddingStore(store_dir)
+        embeddings_result = pd.concat(
+            [
+                store.embeddings_with_labels(run, [epochs[0], epochs[-1]])
+                for run in store.index["run"]
+                for epochs in [store.run_epochs(run)]
+            ],
+            ignore_index=True,
+        )
+    else:
+        embeddings_file = embeddings_result_file(RESULT_BASEDIR, GRAPHNAME)
+        runs = read_report(
+            embeddings_file,
+            columns=["k", "tol", "train_split", "eval", "epoch"],
+        )
+        last_epochs = runs.groupby(["k", "tol", "train_split", "eval"])[
+            "epoch"
+        ]
+        plot_epochs = sorted(
+            {int(runs["epoch"].min())}
+            | set(last_epochs.max().astype(int).tolist())
+        )
+        embeddings_result = read_report(
+            embeddings_file, filters=[("epoch", "in", plot_epochs)]
+        )
     training_embeddings_scatter(FIGURE_BASEDIR, GRAPHNAME, embeddings_result)